@@ -267,6 +267,10 @@ struct BinTypeHelper<TwoD>
         return rsq >= 2.*maxsepsq && rsq >= SQR(sqrt(2.)*maxsep + s1ps2);
     }
 
+    // The number of bins on each side of the grid.
+    static int gridSize(double binsize, double maxsep)
+    { return int(2*maxsep / binsize + 0.5); }
+
     template <int C>
     static int calculateBinK(const Position<C>& p1, const Position<C>& p2,
                              double r, double logr, double binsize,
@@ -277,7 +281,7 @@ struct BinTypeHelper<TwoD>
         double dy = p2.getY() - p1.getY();
         int i = int((dx + maxsep) / binsize);
         int j = int((dy + maxsep) / binsize);
-        int n = int(2*maxsep / binsize+0.5);
+        int n = gridSize(binsize, maxsep);
         Assert(i<=n);
         if (i == n) --i;
         Assert(j<=n);
@@ -317,12 +321,13 @@ struct BinTypeHelper<TwoD>
 
         int i = int(ii);
         int j = int(jj);
+        double ds = s1ps2 / binsize;
         xdbg<<"ii, i = "<<ii<<", "<<i<<std::endl;
-        xdbg<<"i1 = "<<int(ii - s1ps2/binsize)<<std::endl;
-        xdbg<<"i2 = "<<int(ii + s1ps2/binsize)<<std::endl;
+        xdbg<<"i1 = "<<int(ii - ds)<<std::endl;
+        xdbg<<"i2 = "<<int(ii + ds)<<std::endl;
         xdbg<<"jj, j = "<<jj<<", "<<j<<std::endl;
-        xdbg<<"j1 = "<<int(jj - s1ps2/binsize)<<std::endl;
-        xdbg<<"j2 = "<<int(jj + s1ps2/binsize)<<std::endl;
+        xdbg<<"j1 = "<<int(jj - ds)<<std::endl;
+        xdbg<<"j2 = "<<int(jj + ds)<<std::endl;
 
         // With TwoD, we need to be careful about the central bin, which includes r==0.
         // We want to make sure to exclude pairs that are really one point repeated.
@@ -334,12 +339,12 @@ struct BinTypeHelper<TwoD>
         // Check how much ii,jj can change for x,y +- s1ps2
         // This is simpler than the Log case, because we don't have to try to avoid
         // gratuitous log function calls.
-        if (ii - s1ps2/binsize < i) return false;
-        if (ii + s1ps2/binsize >= i+1) return false;
-        if (jj - s1ps2/binsize < j) return false;
-        if (jj + s1ps2/binsize >= j+1) return false;
+        if (ii - ds < i) return false;
+        if (ii + ds >= i+1) return false;
+        if (jj - ds < j) return false;
+        if (jj + ds >= j+1) return false;
 
-        int n = int(2*maxsep / binsize+0.5);
+        int n = gridSize(binsize, maxsep);
         k = j*n + i;
         logr = 0.5*std::log(rsq);
         xdbg<<"Single bin returning true: "<<dx<<','<<dy<<','<<s1ps2<<','<<binsize<<std::endl;
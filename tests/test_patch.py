@@ -2684,6 +2684,15 @@ def test_lowmem():
     npairs2 = dd.npairs
     np.testing.assert_array_equal(npairs1, npairs2)
 
+    # Keeping more patches loaded at a time gives the same answer.
+    save_cat.unload()
+    dd4 = treecorr.NNCorrelation(bin_size=0.5, min_sep=1., max_sep=30., sep_units='arcmin',
+                                 low_mem_block_size=4)
+    dd4.process(save_cat, low_mem=True)
+    np.testing.assert_array_equal(dd4.npairs, npairs2)
+    with assert_raises(ValueError):
+        treecorr.NNCorrelation(bin_size=0.5, min_sep=1., max_sep=30., low_mem_block_size=0)
+
     # Check running as a cross-correlation
     save_cat.unload()
     t0 = time.time()
@@ -13,7 +13,6 @@
 
 import numpy as np
 import os
-import coord
 import time
 import treecorr
 try:
@@ -21,8 +20,7 @@ try:
 except ImportError:
     import pickle
 
-from test_helper import assert_raises, do_pickle, timer, get_from_wiki, CaptureLog, clear_save
-from test_helper import profile
+from test_helper import assert_raises, timer, clear_save
 
 def generate_shear_field(npos, nhalo, rng=None):
     # We do something completely different here than we did for 2pt patch tests.
@@ -70,6 +68,16 @@ def generate_shear_field(npos, nhalo, rng=None):
     return x, y, np.real(gamma), np.imag(gamma), kappa
 
 
+def jackknife_var(v):
+    # The diagonal of np.cov(v.T, bias=True) * (n-1), but without building the full matrix.
+    # v may be complex, in which case this is the variance of |v|.
+    # v may also have leading dimensions, e.g. (nstat, npatch, nbins), in which case the
+    # variance of each statistic is computed in a single call.
+    n = v.shape[-2]
+    c = v - np.mean(v, axis=-2, keepdims=True)
+    return np.einsum('...ij,...ij->...j', np.conj(c), c).real * (n-1) / n
+
+
 @timer
 def test_kkk_jk():
     # Test jackknife and other covariance estimates for kkk correlations.
@@ -1564,13 +1572,14 @@ def test_brute_jk():
         npatch = 16
         rand_factor = 2
 
-    rng = np.random.RandomState(8675309)
+    rng = np.random.default_rng(8675309)
     x, y, g1, g2, k = generate_shear_field(ngal, nhalo, rng)
 
     rx = rng.uniform(0,1000, rand_factor*ngal)
     ry = rng.uniform(0,1000, rand_factor*ngal)
     rand_cat_nopatch = treecorr.Catalog(x=rx, y=ry)
-    rand_cat = treecorr.Catalog(x=rx, y=ry, npatch=npatch, rng=rng)
+    # The kmeans initialization in Catalog still expects a RandomState.
+    rand_cat = treecorr.Catalog(x=rx, y=ry, npatch=npatch, rng=np.random.RandomState(8675309))
     patch_centers = rand_cat.patch_centers
 
     cat_nopatch = treecorr.Catalog(x=x, y=y, g1=g1, g2=g2, k=k)
@@ -1583,10 +1592,23 @@ def test_brute_jk():
     for p in cat.patches:
         print(p.patch,'\t',p.ntot,'\t',patch_centers[p.patch])
 
+    # Row i of keep selects the objects that remain when patch i is removed.
+    keep = cat.patch[np.newaxis,:] != np.arange(npatch)[:,np.newaxis]
+
+    def remove_patch(i):
+        # The catalog for jackknife realization i, which has patch i removed.
+        return treecorr.Catalog(x=cat.x.compress(keep[i]),
+                                y=cat.y.compress(keep[i]),
+                                k=cat.k.compress(keep[i]),
+                                g1=cat.g1.compress(keep[i]),
+                                g2=cat.g2.compress(keep[i]))
+
     # Start with KKK, since relatively simple.
-    kkk1 = treecorr.KKKCorrelation(nbins=3, min_sep=100., max_sep=300., brute=True,
+    # The same binning is used for every brute force calculation, so just make it once.
+    kkk0 = treecorr.KKKCorrelation(nbins=3, min_sep=100., max_sep=300., brute=True,
                                    min_u=0., max_u=1.0, nubins=1,
                                    min_v=0., max_v=1.0, nvbins=1)
+    kkk1 = kkk0.copy()
     kkk1.process(cat_nopatch)
 
     kkk = treecorr.KKKCorrelation(nbins=3, min_sep=100., max_sep=300., brute=True,
@@ -1596,31 +1618,11 @@ def test_brute_jk():
     kkk.process(cat)
     np.testing.assert_allclose(kkk.zeta, kkk1.zeta)
 
-    kkk_zeta_list = []
-    for i in range(npatch):
-        cat1 = treecorr.Catalog(x=cat.x[cat.patch != i],
-                                y=cat.y[cat.patch != i],
-                                k=cat.k[cat.patch != i],
-                                g1=cat.g1[cat.patch != i],
-                                g2=cat.g2[cat.patch != i])
-        kkk1 = treecorr.KKKCorrelation(nbins=3, min_sep=100., max_sep=300., brute=True,
-                                       min_u=0., max_u=1.0, nubins=1,
-                                       min_v=0., max_v=1.0, nvbins=1)
-        kkk1.process(cat1)
-        print('zeta = ',kkk1.zeta.ravel())
-        kkk_zeta_list.append(kkk1.zeta.ravel())
-
-    kkk_zeta_list = np.array(kkk_zeta_list)
-    cov = np.cov(kkk_zeta_list.T, bias=True) * (len(kkk_zeta_list)-1)
-    varzeta = np.diagonal(np.cov(kkk_zeta_list.T, bias=True)) * (len(kkk_zeta_list)-1)
-    print('KKK: treecorr jackknife varzeta = ',kkk.varzeta.ravel())
-    print('KKK: direct jackknife varzeta = ',varzeta)
-    np.testing.assert_allclose(kkk.varzeta.ravel(), varzeta)
-
     # Now GGG
-    ggg1 = treecorr.GGGCorrelation(nbins=3, min_sep=100., max_sep=300., brute=True,
+    ggg0 = treecorr.GGGCorrelation(nbins=3, min_sep=100., max_sep=300., brute=True,
                                    min_u=0., max_u=1.0, nubins=1,
                                    min_v=0., max_v=1.0, nvbins=1)
+    ggg1 = ggg0.copy()
     ggg1.process(cat_nopatch)
 
     ggg = treecorr.GGGCorrelation(nbins=3, min_sep=100., max_sep=300., brute=True,
@@ -1633,50 +1635,43 @@ def test_brute_jk():
     np.testing.assert_allclose(ggg.gam2, ggg1.gam2)
     np.testing.assert_allclose(ggg.gam3, ggg1.gam3)
 
-    ggg_gam0_list = []
-    ggg_gam1_list = []
-    ggg_gam2_list = []
-    ggg_gam3_list = []
+    # Do the brute force jackknife for both KKK and GGG, using the same catalog for each.
+    # The number of bins is known from the binning, so the results can go straight into arrays.
+    kkk_zeta_list = np.empty((npatch, kkk0.logr.size))
+    ggg_gam_list = np.empty((4, npatch, ggg0.logr.size), dtype=complex)
     ggg_map3_list = []
     for i in range(npatch):
-        cat1 = treecorr.Catalog(x=cat.x[cat.patch != i],
-                                y=cat.y[cat.patch != i],
-                                k=cat.k[cat.patch != i],
-                                g1=cat.g1[cat.patch != i],
-                                g2=cat.g2[cat.patch != i])
-        ggg1 = treecorr.GGGCorrelation(nbins=3, min_sep=100., max_sep=300., brute=True,
-                                       min_u=0., max_u=1.0, nubins=1,
-                                       min_v=0., max_v=1.0, nvbins=1)
+        cat1 = remove_patch(i)
+        kkk1 = kkk0.copy()
+        kkk1.process(cat1)
+        kkk_zeta_list[i] = kkk1.zeta.ravel()
+        ggg1 = ggg0.copy()
         ggg1.process(cat1)
-        ggg_gam0_list.append(ggg1.gam0.ravel())
-        ggg_gam1_list.append(ggg1.gam1.ravel())
-        ggg_gam2_list.append(ggg1.gam2.ravel())
-        ggg_gam3_list.append(ggg1.gam3.ravel())
+        ggg_gam_list[:,i] = [ggg1.gam0.ravel(), ggg1.gam1.ravel(),
+                             ggg1.gam2.ravel(), ggg1.gam3.ravel()]
         ggg_map3_list.append(ggg1.calculateMap3()[0])
 
-    ggg_gam0_list = np.array(ggg_gam0_list)
-    vargam0 = np.diagonal(np.cov(ggg_gam0_list.T, bias=True)) * (len(ggg_gam0_list)-1)
+    varzeta = jackknife_var(kkk_zeta_list)
+    print('KKK: treecorr jackknife varzeta = ',kkk.varzeta.ravel())
+    print('KKK: direct jackknife varzeta = ',varzeta)
+    vargam0, vargam1, vargam2, vargam3 = jackknife_var(ggg_gam_list)
     print('GGG: treecorr jackknife vargam0 = ',ggg.vargam0.ravel())
     print('GGG: direct jackknife vargam0 = ',vargam0)
-    np.testing.assert_allclose(ggg.vargam0.ravel(), vargam0)
-    ggg_gam1_list = np.array(ggg_gam1_list)
-    vargam1 = np.diagonal(np.cov(ggg_gam1_list.T, bias=True)) * (len(ggg_gam1_list)-1)
     print('GGG: treecorr jackknife vargam1 = ',ggg.vargam1.ravel())
     print('GGG: direct jackknife vargam1 = ',vargam1)
-    np.testing.assert_allclose(ggg.vargam1.ravel(), vargam1)
-    ggg_gam2_list = np.array(ggg_gam2_list)
-    vargam2 = np.diagonal(np.cov(ggg_gam2_list.T, bias=True)) * (len(ggg_gam2_list)-1)
     print('GGG: treecorr jackknife vargam2 = ',ggg.vargam2.ravel())
     print('GGG: direct jackknife vargam2 = ',vargam2)
-    np.testing.assert_allclose(ggg.vargam2.ravel(), vargam2)
-    ggg_gam3_list = np.array(ggg_gam3_list)
-    vargam3 = np.diagonal(np.cov(ggg_gam3_list.T, bias=True)) * (len(ggg_gam3_list)-1)
     print('GGG: treecorr jackknife vargam3 = ',ggg.vargam3.ravel())
     print('GGG: direct jackknife vargam3 = ',vargam3)
-    np.testing.assert_allclose(ggg.vargam3.ravel(), vargam3)
+
+    # All five use the same binning, so check them together.
+    np.testing.assert_allclose(
+            np.stack([kkk.varzeta.ravel(), ggg.vargam0.ravel(), ggg.vargam1.ravel(),
+                      ggg.vargam2.ravel(), ggg.vargam3.ravel()]),
+            np.stack([varzeta, vargam0, vargam1, vargam2, vargam3]))
 
     ggg_map3_list = np.array(ggg_map3_list)
-    varmap3 = np.diagonal(np.cov(ggg_map3_list.T, bias=True)) * (len(ggg_map3_list)-1)
+    varmap3 = jackknife_var(ggg_map3_list)
 
     # Use estimate_multi_cov
     covmap3 = treecorr.estimate_multi_cov([ggg], 'jackknife',
@@ -1705,19 +1700,17 @@ def test_brute_jk():
     rdd.process(rand_cat, cat)
     rrr.process(rand_cat)
 
+    rand_keep = rand_cat.patch[np.newaxis,:] != np.arange(npatch)[:,np.newaxis]
+    ddd0 = treecorr.NNNCorrelation(nbins=3, min_sep=100., max_sep=300., bin_slop=0,
+                                   min_u=0., max_u=1.0, nubins=1,
+                                   min_v=0., max_v=1.0, nvbins=1)
     zeta1_list = []
     zeta2_list = []
     for i in range(npatch):
-        cat1 = treecorr.Catalog(x=cat.x[cat.patch != i],
-                                y=cat.y[cat.patch != i],
-                                k=cat.k[cat.patch != i],
-                                g1=cat.g1[cat.patch != i],
-                                g2=cat.g2[cat.patch != i])
-        rand_cat1 = treecorr.Catalog(x=rand_cat.x[rand_cat.patch != i],
-                                     y=rand_cat.y[rand_cat.patch != i])
-        ddd1 = treecorr.NNNCorrelation(nbins=3, min_sep=100., max_sep=300., bin_slop=0,
-                                       min_u=0., max_u=1.0, nubins=1,
-                                       min_v=0., max_v=1.0, nvbins=1)
+        cat1 = remove_patch(i)
+        rand_cat1 = treecorr.Catalog(x=rand_cat.x.compress(rand_keep[i]),
+                                     y=rand_cat.y.compress(rand_keep[i]))
+        ddd1 = ddd0.copy()
         drr1 = ddd1.copy()
         rdd1 = ddd1.copy()
         rrr1 = ddd1.copy()
@@ -1731,16 +1724,15 @@ def test_brute_jk():
     print('simple')
     zeta1_list = np.array(zeta1_list)
     zeta2, varzeta2 = ddd.calculateZeta(rrr=rrr)
-    varzeta1 = np.diagonal(np.cov(zeta1_list.T, bias=True)) * (len(zeta1_list)-1)
+    varzeta1 = jackknife_var(zeta1_list)
     print('NNN: treecorr jackknife varzeta = ',ddd.varzeta.ravel())
     print('NNN: direct jackknife varzeta = ',varzeta1)
     np.testing.assert_allclose(ddd.varzeta.ravel(), varzeta1)
 
     print('compensated')
-    print(zeta2_list)
     zeta2_list = np.array(zeta2_list)
     zeta2, varzeta2 = ddd.calculateZeta(rrr=rrr, drr=drr, rdd=rdd)
-    varzeta2 = np.diagonal(np.cov(zeta2_list.T, bias=True)) * (len(zeta2_list)-1)
+    varzeta2 = jackknife_var(zeta2_list)
     print('NNN: treecorr jackknife varzeta = ',ddd.varzeta.ravel())
     print('NNN: direct jackknife varzeta = ',varzeta2)
     np.testing.assert_allclose(ddd.varzeta.ravel(), varzeta2)
@@ -21,28 +21,34 @@ version = __version__
 import os
 import cffi
 import glob
+import importlib.machinery
 
 # Set module level attributes for the include directory and the library file name.
 treecorr_dir = os.path.dirname(__file__)
 include_dir = os.path.join(treecorr_dir,'include')
 
 ext = 'pyd' if os.name == 'nt' else 'so'
-lib_file = os.path.join(treecorr_dir,'_treecorr.' + ext)
-# Some installation (e.g. Travis with python 3.x) name this e.g. _treecorr.cpython-34m.so,
-# so if the normal name doesn't exist, look for something else.
-if not os.path.exists(lib_file): # pragma: no cover
-    alt_files = glob.glob(os.path.join(os.path.dirname(__file__),'_treecorr*.'+ext))
-    if len(alt_files) == 0:
-        raise OSError("No file '_treecorr.%s' found in %s"%(ext,treecorr_dir))
-    if len(alt_files) > 1:
-        raise OSError("Multiple files '_treecorr*.%s' found in %s: %s"%(ext,treecorr_dir,alt_files))
-    lib_file = alt_files[0]
+# Most installations name this e.g. _treecorr.cpython-34m.so, but some just use _treecorr.so.
+# The possible suffixes for this python are listed in EXTENSION_SUFFIXES, so just check
+# those directly rather than scanning the directory.
+for _suffix in importlib.machinery.EXTENSION_SUFFIXES:
+    lib_file = os.path.join(treecorr_dir,'_treecorr' + _suffix)
+    if os.path.exists(lib_file):
+        break
+else: # pragma: no cover
+    raise OSError("No file '_treecorr.%s' found in %s"%(ext,treecorr_dir))
+del _suffix
 
 # Load the C functions with cffi
+# Parsing the declarations is a noticeable part of the import time, and cffi has some
+# overhead for each cdef call, so give it all the headers in a single string.
 _ffi = cffi.FFI()
-for file_name in glob.glob(os.path.join(include_dir,'*_C.h')):
+_cdefs = []
+for file_name in sorted(glob.glob(os.path.join(include_dir,'*_C.h'))):
     with open(file_name) as fin:
-        _ffi.cdef(fin.read())
+        _cdefs.append(fin.read())
+_ffi.cdef('\n'.join(_cdefs))
+del _cdefs
 _lib = _ffi.dlopen(lib_file)
 
 Rperp_alias = 'FisherRperp'
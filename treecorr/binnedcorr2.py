@@ -16,19 +16,148 @@
 """
 
 import math
+import logging
 import numpy as np
 import sys
 import coord
-import itertools
 import collections
+import heapq
 
 from . import _lib
 from .config import merge_config, setup_logger, get
 from .util import parse_metric, metric_enum, coord_enum, set_omp_threads, lazy_property
-from .util import depr_pos_kwargs
+from .util import depr_pos_kwargs, LRU_Cache
+
+def _make_bin_arrays(bin_type, nbins, bin_size, min_sep, max_sep):
+    """Make the arrays describing the nominal bins for the given binning.
+
+    These only depend on the binning parameters, so they are cached and shared among all
+    BinnedCorr2 objects with the same binning (e.g. the many copies made when using patches).
+    Since they are shared, they are made read-only.
+
+    For Log and Linear binning, this returns (rnom, left_edges, right_edges, logr).
+    For TwoD binning, this returns (rnom, dxnom, dynom, logr).
+    """
+    if bin_type == 'Log':
+        # This makes nbins evenly spaced entries in log(r) starting with 0 with step bin_size
+        logr = np.linspace(0, nbins*bin_size, nbins, endpoint=False, dtype=float)
+        # Offset by the position of the center of the first bin.
+        logr += math.log(min_sep) + 0.5*bin_size
+        rnom = np.exp(logr)
+        half_bin = math.exp(0.5*bin_size)
+        arrays = (rnom, rnom / half_bin, rnom * half_bin, logr)
+    elif bin_type == 'Linear':
+        rnom = np.linspace(min_sep, max_sep, nbins, endpoint=False, dtype=float)
+        # Offset by the position of the center of the first bin.
+        rnom += 0.5*bin_size
+        arrays = (rnom, rnom - 0.5*bin_size, rnom + 0.5*bin_size, np.log(rnom))
+    else:
+        sep = np.linspace(-max_sep, max_sep, nbins, endpoint=False, dtype=float)
+        sep += 0.5*bin_size
+        dx, dy = np.meshgrid(sep, sep)
+        rnom = np.sqrt(dx**2 + dy**2)
+        # log(0) = -inf for the central bin, but avoid the warning from numpy about it.
+        logr = np.full_like(rnom, -np.inf)
+        np.log(rnom, out=logr, where=rnom > 0)
+        arrays = (rnom, dx, dy, logr)
+    for a in arrays:
+        a.flags.writeable = False
+    return arrays
+
+_bin_arrays = LRU_Cache(_make_bin_arrays, 32)
+
+def _lpt_schedule(costs, size):
+    """Assign jobs to processes using the greedy longest processing time first rule.
+
+    Each job, in order of decreasing cost, is given to the process with the least total cost
+    assigned so far.  Ties are broken by the job key and the process rank, so every process
+    that calls this with the same inputs gets the same answer.
+
+    :param costs:   A dict {job: cost} with an estimated cost for each job.
+    :param size:    The number of processes.
+
+    :returns:       A dict {job: rank} giving the process that should do each job.
+    """
+    loads = [(0., rank) for rank in range(size)]
+    schedule = {}
+    for job in sorted(costs, key=lambda job: (-costs[job], job)):
+        load, rank = heapq.heappop(loads)
+        schedule[job] = rank
+        heapq.heappush(loads, (load + costs[job], rank))
+    return schedule
+
+class _PackedResults(object):
+    """The values in a results dict, with each accumulated quantity stacked into a single array.
+
+    Each stack is made the first time the quantity is needed.  Then a sum over some subset
+    of the keys (possibly with repeats, e.g. for bootstrap) is a single matrix product rather
+    than a sum over a list of separate arrays.
+
+    The stacks are copies of the arrays in the results, so this trades memory for speed:
+    while it is alive, each stacked quantity is held twice.  It is only made for the temporary
+    copies of the correlation objects used to build the covariance design matrix, so the
+    stacks are released once that is done.
+
+    :param results:     The results dict of a correlation object.
+    """
+    def __init__(self, results):
+        self.index = {key: n for n, key in enumerate(results)}
+        self.values = list(results.values())
+        self.stacks = {}
+        self.lookup = None
+
+    def stack(self, name):
+        if name not in self.stacks:
+            self.stacks[name] = np.array([getattr(c, name) for c in self.values])
+        return self.stacks[name]
+
+    def sum(self, keys):
+        """Return an object whose attributes are the sums of those of the results for keys.
+
+        This can be passed as the only item in the list given to a correlation's _sum method.
+        """
+        if hasattr(keys, 'arrays'):
+            # The pair iterators can give the keys as arrays of patch indices, which we can
+            # convert to positions in the stacks with a single lookup.
+            if self.lookup is None:
+                keys_array = np.array(list(self.index), dtype=int).T
+                # Pairs that are not in the results are marked with -1.
+                self.lookup = np.full(np.max(keys_array, axis=1) + 1, -1, dtype=int)
+                self.lookup[tuple(keys_array)] = np.arange(len(self.values))
+            indices = self.lookup[keys.arrays()]
+            if np.any(indices < 0):
+                raise KeyError("Some of the keys are not in the results.")
+        else:
+            indices = np.array([self.index[key] for key in keys], dtype=int)
+        counts = np.bincount(indices, minlength=len(self.values)).astype(float)
+        return _PackedSum(self, counts)
+
+class _PackedSum(object):
+    # The sum of some of the results in a _PackedResults, computed as each attribute is accessed.
+    def __init__(self, packed, counts):
+        self._packed = packed
+        self._counts = counts
+
+    @property
+    def _nonzero(self):
+        # Like for a single result, this is False if all of the included results are empty.
+        return self._counts[self._packed.stack('_nonzero')].any()
+
+    def __getattr__(self, name):
+        stack = self._packed.stack(name)
+        return self._counts.dot(stack.reshape(len(stack), -1)).reshape(stack.shape[1:])
 
 class Namespace(object):
-    pass
+    # The complete list of read-only attributes that BinnedCorr2 stores in _ro.
+    # Using slots rather than a __dict__ makes these a bit faster to access and saves some
+    # memory for each distinct binning.
+    __slots__ = ('output_dots', 'bin_type', 'sep_units', '_sep_units', '_log_sep_units',
+                 'min_sep', 'max_sep', 'bin_size', 'nbins', 'logr', 'rnom',
+                 'left_edges', 'right_edges', 'dxnom', 'dynom',
+                 '_bintype', '_nbins', '_min_sep', '_max_sep', '_bin_size',
+                 'split_method', 'min_top', 'max_top', 'bin_slop', 'b', 'brute',
+                 'min_rpar', 'max_rpar', 'xperiod', 'yperiod', 'zperiod',
+                 'var_method', 'num_bootstrap', 'low_mem_block_size', '_d1', '_d2')
 
 class BinnedCorr2(object):
     """This class stores the results of a 2-point correlation calculation, along with some
@@ -51,6 +180,12 @@ class BinnedCorr2(object):
         originally designed for weak lensing applications.  But in fact any scalar quantity
         may be used here.  CMB temperature fluctuations for example.
 
+    .. note::
+
+        The nominal binning arrays, ``rnom``, ``logr``, ``left_edges``, ``right_edges``, and
+        for TwoD binning ``dxnom`` and ``dynom``, are shared among all objects with the same
+        binning, so they are immutable.  If you need to modify one, make a copy of it first.
+
     The constructor for all derived classes take a config dict as the first argument,
     since this is often how we keep track of parameters, but if you don't want to
     use one or if you want to change some parameters from what are in a config dict,
@@ -201,6 +336,12 @@ class BinnedCorr2(object):
         rng (RandomState):  If desired, a numpy.random.RandomState instance to use for bootstrap
                             random number generation. (default: None)
 
+        low_mem_block_size (int): If desired, the number of patches to keep loaded at a time
+                            when processing an auto-correlation with ``low_mem=True``.  Larger
+                            values mean fewer loads of each patch from disk, at the cost of
+                            keeping more patches in memory.  (default: None, which means to
+                            keep only 2 patches loaded at a time)
+
         num_threads (int):  How many OpenMP threads to use during the calculation.
                             (default: use the number of cpu cores)
 
@@ -272,6 +413,10 @@ class BinnedCorr2(object):
         'num_bootstrap': (int, False, 500, None,
                 'How many bootstrap samples to use for the var_method=bootstrap and '
                 'marked_bootstrap'),
+        'low_mem_block_size': (int, False, None, None,
+                'How many patches to keep loaded at a time for an auto-correlation with '
+                'low_mem=True.',
+                'The default is to keep only 2 patches loaded at a time.'),
         'num_threads' : (int, False, None, None,
                 'How many threads should be used. num_threads <= 0 means auto based on num cores.'),
     }
@@ -280,9 +425,9 @@ class BinnedCorr2(object):
     def __init__(self, config=None, *, logger=None, rng=None, **kwargs):
         self._corr = None  # Do this first to make sure we always have it for __del__
         self.config = merge_config(config,kwargs,BinnedCorr2._valid_params)
+        verbose = get(self.config,'verbose',int,1)
         if logger is None:
-            self.logger = setup_logger(get(self.config,'verbose',int,1),
-                                       self.config.get('log_file',None))
+            self.logger = setup_logger(verbose, self.config.get('log_file',None))
         else:
             self.logger = logger
 
@@ -297,147 +442,119 @@ class BinnedCorr2(object):
         if 'output_dots' in self.config:
             self._ro.output_dots = get(self.config,'output_dots',bool)
         else:
-            self._ro.output_dots = get(self.config,'verbose',int,1) >= 2
+            self._ro.output_dots = verbose >= 2
 
-        self._ro.bin_type = self.config.get('bin_type', None)
+        bin_type = self._ro.bin_type = self.config.get('bin_type', None)
 
         self._ro.sep_units = self.config.get('sep_units','')
         self._ro._sep_units = get(self.config,'sep_units',str,'radians')
         self._ro._log_sep_units = math.log(self._sep_units)
-        if self.config.get('nbins', None) is None:
-            if self.config.get('max_sep', None) is None:
-                raise TypeError("Missing required parameter max_sep")
-            if self.config.get('min_sep', None) is None and self.bin_type != 'TwoD':
-                raise TypeError("Missing required parameter min_sep")
-            if self.config.get('bin_size', None) is None:
-                raise TypeError("Missing required parameter bin_size")
-            self._ro.min_sep = float(self.config.get('min_sep',0))
-            self._ro.max_sep = float(self.config['max_sep'])
-            if self.min_sep >= self.max_sep:
-                raise ValueError("max_sep must be larger than min_sep")
-            self._ro.bin_size = float(self.config['bin_size'])
-            self._ro.nbins = None
-        elif self.config.get('bin_size', None) is None:
-            if self.config.get('max_sep', None) is None:
-                raise TypeError("Missing required parameter max_sep")
-            if self.config.get('min_sep', None) is None and self.bin_type != 'TwoD':
-                raise TypeError("Missing required parameter min_sep")
-            self._ro.min_sep = float(self.config.get('min_sep',0))
-            self._ro.max_sep = float(self.config['max_sep'])
-            if self.min_sep >= self.max_sep:
-                raise ValueError("max_sep must be larger than min_sep")
-            self._ro.nbins = int(self.config['nbins'])
-            self._ro.bin_size = None
-        elif self.config.get('max_sep', None) is None:
-            if self.config.get('min_sep', None) is None and self.bin_type != 'TwoD':
-                raise TypeError("Missing required parameter min_sep")
-            self._ro.min_sep = float(self.config.get('min_sep',0))
-            self._ro.nbins = int(self.config['nbins'])
-            self._ro.bin_size = float(self.config['bin_size'])
-            self._ro.max_sep = None
+
+        # Exactly three of nbins, bin_size, min_sep, max_sep are required.  The fourth one is
+        # calculated from the other three below.  For TwoD, min_sep isn't part of the binning
+        # (it just excludes small separations), so only two of the other three are required.
+        # Note: merge_config has already converted these to int or float as appropriate.
+        nbins = self.config.get('nbins', None)
+        bin_size = self.config.get('bin_size', None)
+        min_sep = self.config.get('min_sep', None)
+        max_sep = self.config.get('max_sep', None)
+        if bin_type == 'TwoD':
+            binning = (('max_sep', max_sep), ('bin_size', bin_size), ('nbins', nbins))
         else:
-            if self.bin_type == 'TwoD':
+            binning = (('max_sep', max_sep), ('min_sep', min_sep), ('bin_size', bin_size),
+                       ('nbins', nbins))
+        missing = [name for name, value in binning if value is None]
+        if len(missing) == 0:
+            if bin_type == 'TwoD':
                 raise TypeError("Only 2 of max_sep, bin_size, nbins are allowed "
                                 "for bin_type='TwoD'.")
-            if self.config.get('min_sep', None) is not None:
+            else:
                 raise TypeError("Only 3 of min_sep, max_sep, bin_size, nbins are allowed.")
-            self._ro.max_sep = float(self.config['max_sep'])
-            self._ro.nbins = int(self.config['nbins'])
-            self._ro.bin_size = float(self.config['bin_size'])
-            self._ro.min_sep = None
-
-        if self.bin_type == 'Log':
-            if self.nbins is None:
-                self._ro.nbins = int(math.ceil(math.log(self.max_sep/self.min_sep)/self.bin_size))
+        if len(missing) > 1:
+            raise TypeError("Missing required parameter %s"%missing[0])
+        if bin_type == 'TwoD' and min_sep is None:
+            min_sep = 0.
+        if min_sep is not None and max_sep is not None and min_sep >= max_sep:
+            raise ValueError("max_sep must be larger than min_sep")
+
+        if bin_type == 'Log':
+            if nbins is None:
+                nbins = int(math.ceil(math.log(max_sep/min_sep)/bin_size))
                 # Update bin_size given this value of nbins
-                self._ro.bin_size = math.log(self.max_sep/self.min_sep)/self.nbins
-            elif self.bin_size is None:
-                self._ro.bin_size = math.log(self.max_sep/self.min_sep)/self.nbins
-            elif self.max_sep is None:
-                self._ro.max_sep = math.exp(self.nbins*self.bin_size)*self.min_sep
+                bin_size = math.log(max_sep/min_sep)/nbins
+            elif bin_size is None:
+                bin_size = math.log(max_sep/min_sep)/nbins
+            elif max_sep is None:
+                max_sep = math.exp(nbins*bin_size)*min_sep
             else:
-                self._ro.min_sep = self.max_sep*math.exp(-self.nbins*self.bin_size)
-
-            # This makes nbins evenly spaced entries in log(r) starting with 0 with step bin_size
-            self._ro.logr = np.linspace(0, self.nbins*self.bin_size, self.nbins, endpoint=False,
-                                          dtype=float)
-            # Offset by the position of the center of the first bin.
-            self._ro.logr += math.log(self.min_sep) + 0.5*self.bin_size
-            self._ro.rnom = np.exp(self.logr)
-            half_bin = np.exp(0.5*self.bin_size)
-            self._ro.left_edges = self.rnom / half_bin
-            self._ro.right_edges = self.rnom * half_bin
-            self._ro._nbins = self.nbins
+                min_sep = max_sep*math.exp(-nbins*bin_size)
+
+            (self._ro.rnom, self._ro.left_edges, self._ro.right_edges,
+             self._ro.logr) = _bin_arrays(bin_type, nbins, bin_size, min_sep, max_sep)
+            self._ro._nbins = nbins
             self._ro._bintype = _lib.Log
-            max_good_slop = 0.1 / self.bin_size
-        elif self.bin_type == 'Linear':
-            if self.nbins is None:
-                self._ro.nbins = int(math.ceil((self.max_sep-self.min_sep)/self.bin_size))
+            max_good_slop = 0.1 / bin_size
+        elif bin_type == 'Linear':
+            if nbins is None:
+                nbins = int(math.ceil((max_sep-min_sep)/bin_size))
                 # Update bin_size given this value of nbins
-                self._ro.bin_size = (self.max_sep-self.min_sep)/self.nbins
-            elif self.bin_size is None:
-                self._ro.bin_size = (self.max_sep-self.min_sep)/self.nbins
-            elif self.max_sep is None:
-                self._ro.max_sep = self.min_sep + self.nbins*self.bin_size
+                bin_size = (max_sep-min_sep)/nbins
+            elif bin_size is None:
+                bin_size = (max_sep-min_sep)/nbins
+            elif max_sep is None:
+                max_sep = min_sep + nbins*bin_size
             else:
-                self._ro.min_sep = self.max_sep - self.nbins*self.bin_size
-
-            self._ro.rnom = np.linspace(self.min_sep, self.max_sep, self.nbins, endpoint=False,
-                                          dtype=float)
-            # Offset by the position of the center of the first bin.
-            self._ro.rnom += 0.5*self.bin_size
-            self._ro.left_edges = self.rnom - 0.5*self.bin_size
-            self._ro.right_edges = self.rnom + 0.5*self.bin_size
-            self._ro.logr = np.log(self.rnom)
-            self._ro._nbins = self.nbins
+                min_sep = max_sep - nbins*bin_size
+
+            (self._ro.rnom, self._ro.left_edges, self._ro.right_edges,
+             self._ro.logr) = _bin_arrays(bin_type, nbins, bin_size, min_sep, max_sep)
+            self._ro._nbins = nbins
             self._ro._bintype = _lib.Linear
             # max dr/r = 0.1,
             # dr = bin_slop * bin_size
             # min r = min_sep
-            max_good_slop = 0.1 * (self.min_sep + self.bin_size/2) / self.bin_size
-        elif self.bin_type == 'TwoD':
-            if self.nbins is None:
-                self._ro.nbins = int(math.ceil(2.*self.max_sep / self.bin_size))
-                self._ro.bin_size = 2.*self.max_sep/self.nbins
-            elif self.bin_size is None:
-                self._ro.bin_size = 2.*self.max_sep/self.nbins
+            max_good_slop = 0.1 * (min_sep + bin_size/2) / bin_size
+        elif bin_type == 'TwoD':
+            if nbins is None:
+                nbins = int(math.ceil(2.*max_sep / bin_size))
+                bin_size = 2.*max_sep/nbins
+            elif bin_size is None:
+                bin_size = 2.*max_sep/nbins
             else:
-                self._ro.max_sep = self.nbins * self.bin_size / 2.
-
-            sep = np.linspace(-self.max_sep, self.max_sep, self.nbins, endpoint=False,
-                              dtype=float)
-            sep += 0.5 * self.bin_size
-            dx, dy = np.meshgrid(sep, sep)
-            self._ro.dxnom = dx
-            self._ro.dynom = dy
-            self._ro.left_edges = dx - 0.5*self.bin_size
-            self._ro.right_edges = dx + 0.5*self.bin_size
-            self._ro.bottom_edges = dy - 0.5*self.bin_size
-            self._ro.top_edges = dy + 0.5*self.bin_size
-            self._ro.rnom = np.sqrt(dx**2 + dy**2)
-            self._ro.logr = np.zeros_like(self.rnom)
-            np.log(self.rnom, out=self._ro.logr, where=self.rnom > 0)
-            self._ro.logr[self.rnom==0.] = -np.inf
-            self._ro._nbins = self.nbins**2
+                max_sep = nbins * bin_size / 2.
+
+            # The edges are just dxnom, dynom +- bin_size/2, so rather than store four more
+            # nbins x nbins grids, the edge properties compute them when requested.
+            self._ro.rnom, self._ro.dxnom, self._ro.dynom, self._ro.logr = _bin_arrays(
+                    bin_type, nbins, bin_size, min_sep, max_sep)
+            self._ro._nbins = nbins**2
             self._ro._bintype = _lib.TwoD
             max_good_slop = 0.1
         else:  # pragma: no cover  (Already checked by config layer)
-            raise ValueError("Invalid bin_type %s"%self.bin_type)
-
-        if self.sep_units == '':
-            self.logger.info("nbins = %d, min,max sep = %g..%g, bin_size = %g",
-                             self.nbins, self.min_sep, self.max_sep, self.bin_size)
-        else:
-            self.logger.info("nbins = %d, min,max sep = %g..%g %s, bin_size = %g",
-                             self.nbins, self.min_sep, self.max_sep, self.sep_units,
-                             self.bin_size)
+            raise ValueError("Invalid bin_type %s"%bin_type)
+        self._ro.nbins = nbins
+        self._ro.bin_size = bin_size
+        self._ro.min_sep = min_sep
+        self._ro.max_sep = max_sep
+
+        # Many of these objects may be made when using patches, so skip the logging calls
+        # entirely unless they will actually output something.
+        if self.logger.isEnabledFor(logging.INFO):
+            if self.sep_units == '':
+                self.logger.info("nbins = %d, min,max sep = %g..%g, bin_size = %g",
+                                 self.nbins, self.min_sep, self.max_sep, self.bin_size)
+            else:
+                self.logger.info("nbins = %d, min,max sep = %g..%g %s, bin_size = %g",
+                                 self.nbins, self.min_sep, self.max_sep, self.sep_units,
+                                 self.bin_size)
         # The underscore-prefixed names are in natural units (radians for angles)
-        self._ro._min_sep = self.min_sep * self._sep_units
-        self._ro._max_sep = self.max_sep * self._sep_units
-        if self.bin_type in ['Linear', 'TwoD']:
-            self._ro._bin_size = self.bin_size * self._sep_units
+        sep_units = self._ro._sep_units
+        self._ro._min_sep = min_sep * sep_units
+        self._ro._max_sep = max_sep * sep_units
+        if bin_type in ['Linear', 'TwoD']:
+            self._ro._bin_size = bin_size * sep_units
         else:
-            self._ro._bin_size = self.bin_size
+            self._ro._bin_size = bin_size
 
         self._ro.split_method = self.config.get('split_method','mean')
         self.logger.debug("Using split_method = %s",self.split_method)
@@ -445,20 +562,22 @@ class BinnedCorr2(object):
         self._ro.min_top = get(self.config,'min_top',int,None)
         self._ro.max_top = get(self.config,'max_top',int,10)
 
-        self._ro.bin_slop = get(self.config,'bin_slop',float,-1.0)
-        if self.bin_slop < 0.0:
-            self._ro.bin_slop = min(max_good_slop, 1.0)
-        self._ro.b = self.bin_size * self.bin_slop
-        if self.bin_slop > max_good_slop + 0.0001:  # Add some numerical slop
+        bin_slop = get(self.config,'bin_slop',float,-1.0)
+        if bin_slop < 0.0:
+            bin_slop = min(max_good_slop, 1.0)
+        b = bin_size * bin_slop
+        self._ro.bin_slop = bin_slop
+        self._ro.b = b
+        if bin_slop > max_good_slop + 0.0001:  # Add some numerical slop
             self.logger.warning(
-                "Using bin_slop = %g, bin_size = %g, b = %g\n"%(self.bin_slop,self.bin_size,self.b)+
+                "Using bin_slop = %g, bin_size = %g, b = %g\n"%(bin_slop,bin_size,b)+
                 "It is recommended to use bin_slop <= %s in this case.\n"%max_good_slop+
                 "Larger values of bin_slop (and hence b) may result in significant inaccuracies.")
         else:
-            self.logger.debug("Using bin_slop = %g, b = %g",self.bin_slop,self.b)
+            self.logger.debug("Using bin_slop = %g, b = %g",bin_slop,b)
 
         self._ro.brute = get(self.config,'brute',bool,False)
-        if self.brute:
+        if self.brute and self.logger.isEnabledFor(logging.INFO):
             self.logger.info("Doing brute force calculation%s.",
                              self.brute is True and "" or
                              self.brute == 1 and " for first field" or
@@ -476,6 +595,9 @@ class BinnedCorr2(object):
 
         self._ro.var_method = get(self.config,'var_method',str,'shot')
         self._ro.num_bootstrap = get(self.config,'num_bootstrap',int,500)
+        self._ro.low_mem_block_size = get(self.config,'low_mem_block_size',int,None)
+        if self.low_mem_block_size is not None and self.low_mem_block_size < 1:
+            raise ValueError("low_mem_block_size must be at least 1")
         self.results = {}  # for jackknife, etc. store the results of each pair of patches.
         self.npatch1 = self.npatch2 = 1
         self._rng = rng
@@ -510,13 +632,19 @@ class BinnedCorr2(object):
     @property
     def rnom(self): return self._ro.rnom
     @property
-    def left_edges(self): return self._ro.left_edges
+    def left_edges(self):
+        if self.bin_type == 'TwoD':
+            return self.dxnom - 0.5*self.bin_size
+        return self._ro.left_edges
     @property
-    def right_edges(self): return self._ro.right_edges
+    def right_edges(self):
+        if self.bin_type == 'TwoD':
+            return self.dxnom + 0.5*self.bin_size
+        return self._ro.right_edges
     @property
-    def top_edges(self): return self._ro.top_edges
+    def top_edges(self): return self.dynom + 0.5*self.bin_size
     @property
-    def bottom_edges(self): return self._ro.bottom_edges
+    def bottom_edges(self): return self.dynom - 0.5*self.bin_size
     @property
     def dxnom(self): return self._ro.dxnom
     @property
@@ -558,6 +686,8 @@ class BinnedCorr2(object):
     @property
     def num_bootstrap(self): return self._ro.num_bootstrap
     @property
+    def low_mem_block_size(self): return self._ro.low_mem_block_size
+    @property
     def _d1(self): return self._ro._d1
     @property
     def _d2(self): return self._ro._d2
@@ -593,7 +723,57 @@ class BinnedCorr2(object):
     def nonzero(self):
         """Return if there are any values accumulated yet.  (i.e. npairs > 0)
         """
-        return np.any(self.npairs)
+        return self.npairs.any()
+
+    def _new_temp(self, temp):
+        # Get a cleared object to accumulate the next patch pair into.  The first time,
+        # temp is None, so make one.
+        if temp is None:
+            temp = self.copy()
+            temp.results = {}  # Don't mess up the original results
+        temp._clear()
+        return temp
+
+    def _add_result(self, key, temp):
+        # Add temp into both self and self.results[key].
+        self += temp
+        if key not in self.results:
+            # Store a copy rather than temp itself.  Once temp has processed something, it
+            # holds a C++ corr object pointing at its arrays.  The copy doesn't, so the
+            # stored results are just the numpy arrays and some shared references, and the
+            # single C++ object for temp keeps being reused for the next pair.
+            self.results[key] = temp.copy()
+        else:
+            self.results[key] += temp
+
+    def _process_auto_job(self, temp, c1, i, metric, num_threads):
+        # Process the auto-correlation of patch i, and add it to self and self.results.
+        # Returns the temp to use for the next job.
+        temp = self._new_temp(temp)
+        self.logger.info('Process patch %d auto',i)
+        temp.process_auto(c1, metric=metric, num_threads=num_threads)
+        self._add_result((i,i), temp)
+        return temp
+
+    def _process_cross_job(self, temp, c1, c2, i, j, metric, num_threads):
+        # Process the cross-correlation of patches i,j in the auto-correlation of a
+        # patch-based catalog, and add it to self and self.results.
+        # Returns the temp to use for the next job.
+        if self._trivially_zero(c1,c2,metric):
+            # Nothing to process, so there is no need to clear temp either.
+            self.logger.info('Skipping %d,%d pair, which are too far apart ' +
+                             'for this set of separations',i,j)
+            # NNCorrelation needs to add the tot value
+            self._add_tot(i, j, c1, c2)
+        else:
+            temp = self._new_temp(temp)
+            self.logger.info('Process patches %d,%d cross',i,j)
+            temp.process_cross(c1, c2, metric=metric, num_threads=num_threads)
+            if temp.nonzero:
+                self._add_result((i,j), temp)
+            else:
+                self._add_tot(i, j, c1, c2)
+        return temp
 
     def _add_tot(self, i, j, c1, c2):
         # No op for all but NNCorrelation, which needs to add the tot value
@@ -607,6 +787,40 @@ class BinnedCorr2(object):
                                   self._metric, self._coords,
                                   x1, y1, z1, s1, x2, y2, z2, s2)
 
+    def _reduce_results(self, comm):
+        # Combine the results from all processes onto rank 0 using a binary tree.
+        # At each step, half of the processes still holding results send them to a partner,
+        # which merges them.  So rank 0 only has log2(size) merges in sequence, rather than
+        # receiving from every other process in turn.
+        rank = comm.Get_rank()
+        size = comm.Get_size()
+        step = 1
+        while step < size:
+            if rank % (2*step) == step:
+                comm.send(self, dest=rank-step)
+                break
+            elif rank + step < size:
+                temp = comm.recv(source=rank+step)
+                self += temp
+                self.results.update(temp.results)
+            step *= 2
+
+    def _auto_schedule(self, cat1, metric, size):
+        # Estimate the cost of each job as the number of pairs of objects it involves.
+        # Pairs of patches that are too far apart to have any pairs in range are nearly free.
+        costs = {}
+        for ii,c1 in enumerate(cat1):
+            i = c1.patch if c1.patch is not None else ii
+            costs[(i,i)] = 0.5 * c1.nobj**2
+            for jj,c2 in enumerate(cat1):
+                j = c2.patch if c2.patch is not None else jj
+                if i < j:
+                    if self._trivially_zero(c1,c2,metric):
+                        costs[(i,j)] = 0.
+                    else:
+                        costs[(i,j)] = float(c1.nobj) * c2.nobj
+        return _lpt_schedule(costs, size)
+
     def _process_all_auto(self, cat1, metric, num_threads, comm, low_mem):
 
         def is_my_job(my_indices, i, j, n):
@@ -617,7 +831,14 @@ class BinnedCorr2(object):
             if my_indices is None:
                 return True
 
-            # Now the tricky part.  If using MPI, we need to divide up the jobs smartly.
+            # If we have a precomputed schedule, just use that.
+            if schedule is not None:
+                ret = schedule[(i,j)] == rank
+                if ret and log_jobs:
+                    self.logger.info("Rank %d: Job (%d,%d) is mine.",rank,i,j)
+                return ret
+
+            # Otherwise, the tricky part.  If using MPI, we need to divide up the jobs smartly.
             # The first point is to divvy up the auto jobs evenly.  This is where most of the
             # work is done, so we want those to be spreads as evenly as possibly across procs.
             # Therefore, if both indices are mine, then do the job.
@@ -625,7 +846,8 @@ class BinnedCorr2(object):
             # If the auto i,i and j,j are both my job, then i and j are already being loaded
             # on this machine, so also do that job.
             if i in my_indices and j in my_indices:
-                self.logger.info("Rank %d: Job (%d,%d) is mine.",rank,i,j)
+                if log_jobs:
+                    self.logger.info("Rank %d: Job (%d,%d) is mine.",rank,i,j)
                 return True
 
             # If neither index is mine, then it's not my job.
@@ -645,7 +867,7 @@ class BinnedCorr2(object):
                 ret = i % 2 == (0 if i in my_indices else 1)
             else:
                 ret = j % 2 == (0 if j in my_indices else 1)
-            if ret:
+            if ret and log_jobs:
                 self.logger.info("Rank %d: Job (%d,%d) is mine.",rank,i,j)
             return ret
 
@@ -657,65 +879,86 @@ class BinnedCorr2(object):
                 self.npatch1 = self.npatch2 = cat1[0].npatch if cat1[0].npatch != 1 else len(cat1)
             n = self.npatch1
 
+            self._set_metric(metric, cat1[0].coords)
+
             # Setup for deciding when this is my job.
+            schedule = None
             if comm:
                 size = comm.Get_size()
                 rank = comm.Get_rank()
-                my_indices = np.arange(n * rank // size, n * (rank+1) // size)
+                # is_my_job is called for every pair of patches, so skip the logging calls there
+                # entirely unless they will actually be output.
+                log_jobs = self.logger.isEnabledFor(logging.INFO)
+                # Use a range, so `i in my_indices` in is_my_job is a cheap O(1) check.
+                my_indices = range(n * rank // size, n * (rank+1) // size)
                 self.logger.info("Rank %d: My indices are %s",rank,my_indices)
+                # If all the patches are already in memory, then there is no I/O to minimize,
+                # so balance the expected work across processes instead.  Rank 0 decides, so
+                # all processes are guaranteed to use the same assignments.
+                if rank == 0 and not low_mem and all(c.loaded for c in cat1):
+                    schedule = self._auto_schedule(cat1, metric, size)
+                schedule = comm.bcast(schedule, root=0)
             else:
                 my_indices = None
 
-            self._set_metric(metric, cat1[0].coords)
-            temp = self.copy()
-            temp.results = {}  # Don't mess up the original results
-            for ii,c1 in enumerate(cat1):
-                i = c1.patch if c1.patch is not None else ii
-                if is_my_job(my_indices, i, i, n):
-                    temp._clear()
-                    self.logger.info('Process patch %d auto',i)
-                    temp.process_auto(c1, metric=metric, num_threads=num_threads)
-                    if (i,i) not in self.results:
-                        self.results[(i,i)] = temp.copy()
-                    else:
-                        self.results[(i,i)] += temp
-                    self += temp
-                for jj,c2 in list(enumerate(cat1))[::-1]:
-                    j = c2.patch if c2.patch is not None else jj
-                    if i < j and is_my_job(my_indices, i, j, n):
-                        temp._clear()
-                        if not self._trivially_zero(c1,c2,metric):
-                            self.logger.info('Process patches %d,%d cross',i,j)
-                            temp.process_cross(c1, c2, metric=metric, num_threads=num_threads)
-                        else:
-                            self.logger.info('Skipping %d,%d pair, which are too far apart ' +
-                                             'for this set of separations',i,j)
-                        if temp.nonzero:
-                            if (i,j) not in self.results:
-                                self.results[(i,j)] = temp.copy()
-                            else:
-                                self.results[(i,j)] += temp
-                            self += temp
-                        else:
-                            # NNCorrelation needs to add the tot value
-                            self._add_tot(i, j, c1, c2)
-                        if low_mem and jj != ii+1:
-                            # Don't unload i+1, since that's the next one we'll need.
-                            c2.unload()
-                if low_mem:
-                    c1.unload()
+            def patch_num(kk):
+                return cat1[kk].patch if cat1[kk].patch is not None else kk
+
+            def process_pair(temp, kk1, kk2):
+                # Do the cross job for the catalogs at indices kk1, kk2, if it is ours.
+                # The job is labeled with the lower patch number first.
+                i = patch_num(kk1)
+                j = patch_num(kk2)
+                if j < i:
+                    kk1, kk2, i, j = kk2, kk1, j, i
+                if i < j and is_my_job(my_indices, i, j, n):
+                    temp = self._process_cross_job(temp, cat1[kk1], cat1[kk2], i, j,
+                                                   metric, num_threads)
+                return temp
+
+            temp = None
+            ncat = len(cat1)
+            if low_mem and self.low_mem_block_size is not None:
+                # Work through the catalogs in blocks.  Each block stays loaded while we do all
+                # the jobs within it, and then each later catalog is loaded once to do all of its
+                # jobs with the catalogs in the block.  This reduces the number of loads from
+                # about ncat**2/2 to ncat**2/(2*block_size), at the cost of keeping block_size
+                # catalogs in memory rather than 2.
+                block_size = self.low_mem_block_size
+                for k0 in range(0, ncat, block_size):
+                    block = range(k0, min(k0 + block_size, ncat))
+                    for ii in block:
+                        i = patch_num(ii)
+                        if is_my_job(my_indices, i, i, n):
+                            temp = self._process_auto_job(temp, cat1[ii], i, metric, num_threads)
+                        for jj in range(ii+1, block.stop):
+                            temp = process_pair(temp, ii, jj)
+                    for jj in range(block.stop, ncat):
+                        for ii in block:
+                            temp = process_pair(temp, ii, jj)
+                        cat1[jj].unload()
+                    for ii in block:
+                        cat1[ii].unload()
+            else:
+                for ii,c1 in enumerate(cat1):
+                    i = patch_num(ii)
+                    if is_my_job(my_indices, i, i, n):
+                        temp = self._process_auto_job(temp, c1, i, metric, num_threads)
+                    for jj in range(ncat-1, -1, -1):
+                        c2 = cat1[jj]
+                        j = patch_num(jj)
+                        if i < j and is_my_job(my_indices, i, j, n):
+                            temp = self._process_cross_job(temp, c1, c2, i, j, metric, num_threads)
+                            if low_mem and jj != ii+1:
+                                # Don't unload i+1, since that's the next one we'll need.
+                                c2.unload()
+                    if low_mem:
+                        c1.unload()
             if comm is not None:
                 rank = comm.Get_rank()
-                size = comm.Get_size()
                 self.logger.info("Rank %d: Completed jobs %s",rank,list(self.results.keys()))
                 # Send all the results back to rank 0 process.
-                if rank > 0:
-                    comm.send(self, dest=0)
-                else:
-                    for p in range(1,size):
-                        temp = comm.recv(source=p)
-                        self += temp
-                        self.results.update(temp.results)
+                self._reduce_results(comm)
 
     def _process_all_cross(self, cat1, cat2, metric, num_threads, comm, low_mem):
 
@@ -734,7 +977,8 @@ class BinnedCorr2(object):
             else:
                 k = j
             if k in my_indices:
-                self.logger.info("Rank %d: Job (%d,%d) is mine.",rank,i,j)
+                if log_jobs:
+                    self.logger.info("Rank %d: Job (%d,%d) is mine.",rank,i,j)
                 return True
             else:
                 return False
@@ -767,33 +1011,33 @@ class BinnedCorr2(object):
             if comm:
                 size = comm.Get_size()
                 rank = comm.Get_rank()
+                log_jobs = self.logger.isEnabledFor(logging.INFO)
                 n = max(n1,n2)
-                my_indices = np.arange(n * rank // size, n * (rank+1) // size)
+                my_indices = range(n * rank // size, n * (rank+1) // size)
                 self.logger.info("Rank %d: My indices are %s",rank,my_indices)
             else:
                 my_indices = None
 
             self._set_metric(metric, cat1[0].coords, cat2[0].coords)
-            temp = self.copy()
-            temp.results = {}  # Don't mess up the original results
+            temp = None
             for ii,c1 in enumerate(cat1):
                 i = c1.patch if c1.patch is not None else ii
                 for jj,c2 in enumerate(cat2):
                     j = c2.patch if c2.patch is not None else jj
                     if is_my_job(my_indices, i, j, n1, n2):
-                        temp._clear()
+                        keep = i==j or n1==1 or n2==1
                         if not self._trivially_zero(c1,c2,metric):
+                            temp = self._new_temp(temp)
                             self.logger.info('Process patches %d,%d cross',i,j)
                             temp.process_cross(c1, c2, metric=metric, num_threads=num_threads)
+                            keep = keep or temp.nonzero
                         else:
                             self.logger.info('Skipping %d,%d pair, which are too far apart ' +
                                              'for this set of separations',i,j)
-                        if temp.nonzero or i==j or n1==1 or n2==1:
-                            if (i,j) not in self.results:
-                                self.results[(i,j)] = temp.copy()
-                            else:
-                                self.results[(i,j)] += temp
-                            self += temp
+                            if keep:
+                                temp = self._new_temp(temp)
+                        if keep:
+                            self._add_result((i,j), temp)
                         else:
                             # NNCorrelation needs to add the tot value
                             self._add_tot(i, j, c1, c2)
@@ -803,16 +1047,9 @@ class BinnedCorr2(object):
                     c1.unload()
             if comm is not None:
                 rank = comm.Get_rank()
-                size = comm.Get_size()
                 self.logger.info("Rank %d: Completed jobs %s",rank,list(self.results.keys()))
                 # Send all the results back to rank 0 process.
-                if rank > 0:
-                    comm.send(self, dest=0)
-                else:
-                    for p in range(1,size):
-                        temp = comm.recv(source=p)
-                        self += temp
-                        self.results.update(temp.results)
+                self._reduce_results(comm)
 
     def getStat(self):
         """The standard statistic for the current correlation object as a 1-d array.
@@ -1002,13 +1239,23 @@ class BinnedCorr2(object):
         self._metric = metric_enum(metric)
 
     def _apply_units(self, mask):
+        # Do these in place with where=mask, rather than with fancy indexing, which would
+        # make a masked copy for every step.
+        meanr = self.meanr
+        meanlogr = self.meanlogr
         if self.coords == 'spherical' and self.metric == 'Euclidean':
             # Then our distances are all angles.  Convert from the chord distance to a real angle.
             # L = 2 sin(theta/2)
-            self.meanr[mask] = 2. * np.arcsin(self.meanr[mask]/2.)
-            self.meanlogr[mask] = np.log( 2. * np.arcsin(np.exp(self.meanlogr[mask])/2.) )
-        self.meanr[mask] /= self._sep_units
-        self.meanlogr[mask] -= self._log_sep_units
+            np.multiply(meanr, 0.5, out=meanr, where=mask)
+            np.arcsin(meanr, out=meanr, where=mask)
+            np.multiply(meanr, 2., out=meanr, where=mask)
+            np.exp(meanlogr, out=meanlogr, where=mask)
+            np.multiply(meanlogr, 0.5, out=meanlogr, where=mask)
+            np.arcsin(meanlogr, out=meanlogr, where=mask)
+            np.multiply(meanlogr, 2., out=meanlogr, where=mask)
+            np.log(meanlogr, out=meanlogr, where=mask)
+        np.divide(meanr, self._sep_units, out=meanr, where=mask)
+        np.subtract(meanlogr, self._log_sep_units, out=meanlogr, where=mask)
 
     def _get_minmax_size(self):
         if self.metric == 'Euclidean':
@@ -1147,12 +1394,27 @@ class BinnedCorr2(object):
     def _get_npatch(self):
         return max(self.npatch1, self.npatch2)
 
+    def _pack_results(self):
+        # Stack the results, so _sum_pairs can be done efficiently.  This should only be done
+        # when the results won't change anymore, e.g. on the copies used for the covariance
+        # design matrix.
+        self._packed_results = _PackedResults(self.results)
+
+    def _sum_pairs(self, pairs):
+        # Equivalent to self._sum([self.results[ij] for ij in pairs]), but faster if the results
+        # have been packed.
+        packed = getattr(self, '_packed_results', None)
+        if packed is None:
+            self._sum([self.results[ij] for ij in pairs])
+        else:
+            self._sum([packed.sum(pairs)])
+
     def _calculate_xi_from_pairs(self, pairs):
         # Compute the xi data vector for the given list of pairs.
         # pairs is input as a list of (i,j) values.
 
         # This is the normal calculation.  It needs to be overridden when there are randoms.
-        self._sum([self.results[ij] for ij in pairs])
+        self._sum_pairs(pairs)
         self._finalize()
 
     #########################################################################################
@@ -1178,6 +1440,9 @@ class BinnedCorr2(object):
     #########################################################################################
 
     class PairIterator(collections.abc.Iterator):
+        # Each subclass defines arrays(), which returns the pairs as two arrays of patch
+        # indices, (i values, j values).  The covariance calculation uses these directly when
+        # the results have been packed, which is much faster than going through the tuples.
         def __init__(self, results, npatch1, npatch2, index, ok=None):
             self.results = results
             self.npatch1 = npatch1
@@ -1186,39 +1451,58 @@ class BinnedCorr2(object):
             self.ok = ok
 
         def __iter__(self):
-            self.gen = iter(self.make_gen())
+            ii, jj = self.arrays()
+            self.gen = zip(ii.tolist(), jj.tolist())
             return self
 
         def __next__(self):
             return next(self.gen)
 
+        def __len__(self):
+            return len(self.arrays()[0])
+
+    class FixedPairIterator(PairIterator):
+        # The pairs from some other iterator, found once and then kept.
+        def __init__(self, arrays):
+            self._arrays = arrays
+
+        def arrays(self):
+            return self._arrays
+
     class JackknifePairIterator(PairIterator):
-        def make_gen(self):
+        def arrays(self):
+            # Rather than scanning all the results keys in python for each i, knock out the
+            # excluded row and/or column of the ok matrix and let numpy find the rest.
+            ok = self.ok.copy()
             if self.npatch2 == 1:
                 # k=0 here
-                return ((j,k) for j,k in self.results.keys() if j!=self.index)
+                ok[self.index,:] = False
             elif self.npatch1 == 1:
                 # j=0 here
-                return ((j,k) for j,k in self.results.keys() if k!=self.index)
+                ok[:,self.index] = False
             else:
                 # For each i:
                 #    Select all pairs where neither is i.
                 assert self.npatch1 == self.npatch2
-                return ((j,k) for j,k in self.results.keys() if j!=self.index and k!=self.index)
+                ok[self.index,:] = False
+                ok[:,self.index] = False
+            return np.nonzero(ok)
 
     def _jackknife_pairs(self):
         np = self.npatch1 if self.npatch1 != 1 else self.npatch2
-        return [self.JackknifePairIterator(self.results, self.npatch1, self.npatch2, i)
+        return [self.JackknifePairIterator(self.results, self.npatch1, self.npatch2, i, self._ok)
                 for i in range(np)]
 
     class SamplePairIterator(PairIterator):
-        def make_gen(self):
+        def arrays(self):
+            # As for the jackknife, the pairs to use are read off from the ok matrix.
+            ok = np.zeros_like(self.ok)
             if self.npatch2 == 1:
                 # k=0 here.
-                return ((j,k) for j,k in self.results.keys() if j==self.index)
+                ok[self.index,0] = self.ok[self.index,0]
             elif self.npatch1 == 1:
                 # j=0 here.
-                return ((j,k) for j,k in self.results.keys() if k==self.index)
+                ok[0,self.index] = self.ok[0,self.index]
             else:
                 assert self.npatch1 == self.npatch2
                 # Note: It's not obvious to me a priori which of these should be the right choice.
@@ -1227,15 +1511,17 @@ class BinnedCorr2(object):
                 #       using.
                 # For each i:
                 #    Select all pairs where either is i.
-                #return ((j,k) for j,k in self.results.keys() if j==self.index or k==self.index)
+                #ok[self.index,:] = self.ok[self.index,:]
+                #ok[:,self.index] = self.ok[:,self.index]
                 #
                 # For each i:
                 #    Select all pairs where first is i.
-                return ((j,k) for j,k in self.results.keys() if j==self.index)
+                ok[self.index,:] = self.ok[self.index,:]
+            return np.nonzero(ok)
 
     def _sample_pairs(self):
         np = self.npatch1 if self.npatch1 != 1 else self.npatch2
-        return [self.SamplePairIterator(self.results, self.npatch1, self.npatch2, i)
+        return [self.SamplePairIterator(self.results, self.npatch1, self.npatch2, i, self._ok)
                 for i in range(np)]
 
     @lazy_property
@@ -1248,25 +1534,33 @@ class BinnedCorr2(object):
         return ok
 
     class MarkedPairIterator(PairIterator):
-        def make_gen(self):
+        def arrays(self):
+            index = np.asarray(self.index, dtype=int)
             if self.npatch2 == 1:
-                return ( (i,0) for i in self.index if self.ok[i,0] )
+                ii = index[self.ok[index,0]]
+                return ii, np.zeros_like(ii)
             elif self.npatch1 == 1:
-                return ( (0,i) for i in self.index if self.ok[0,i] )
+                jj = index[self.ok[0,index]]
+                return np.zeros_like(jj), jj
             else:
                 assert self.npatch1 == self.npatch2
                 # Select all pairs where first point is in index (repeating i as appropriate)
-                return ( (i,j) for i in self.index for j in range(self.npatch2) if self.ok[i,j] )
+                # Gathering the rows of ok lets numpy do the double loop.
+                rr, cc = np.nonzero(self.ok[index])
+                return index[rr], cc
 
     def _marked_pairs(self, index):
         return self.MarkedPairIterator(self.results, self.npatch1, self.npatch2, index, self._ok)
 
     class BootstrapPairIterator(PairIterator):
-        def make_gen(self):
+        def arrays(self):
+            index = np.asarray(self.index, dtype=int)
             if self.npatch2 == 1:
-                return ( (i,0) for i in self.index if self.ok[i,0] )
+                ii = index[self.ok[index,0]]
+                return ii, np.zeros_like(ii)
             elif self.npatch1 == 1:
-                return ( (0,i) for i in self.index if self.ok[0,i] )
+                jj = index[self.ok[0,index]]
+                return np.zeros_like(jj), jj
             else:
                 assert self.npatch1 == self.npatch2
                 # Include all represented auto-correlations once, repeating as appropriate.
@@ -1274,15 +1568,16 @@ class BinnedCorr2(object):
                 # that you would get by looping i in index and j in index for cases where i=j at
                 # different places in the index list.  E.g. if i=3 shows up 3 times in index, then
                 # the naive way would get 9 instance of (3,3), whereas we only want 3 instances.
-                ret1 = ( (i,i) for i in self.index if self.ok[i,i] )
+                ii = index[self.ok[index,index]]
 
                 # And all other pairs that aren't really auto-correlations.
                 # These can happen at their natural multiplicity from i and j loops.
-                # Note: This is way faster with the precomputed ok matrix.
-                # Like 0.005 seconds per call rather than 1.2 seconds for 128 patches!
-                ret2 = ( (i,j) for i in self.index for j in self.index if self.ok[i,j] and i!=j )
+                # Note: This is way faster with the precomputed ok matrix, and doing the
+                # double loop over index as a single numpy selection is faster still.
+                sub = self.ok[np.ix_(index,index)] & (index[:,None] != index[None,:])
+                rr, cc = np.nonzero(sub)
 
-                return itertools.chain(ret1, ret2)
+                return np.concatenate([ii, index[rr]]), np.concatenate([ii, index[cc]])
 
     def _bootstrap_pairs(self, index):
         return self.BootstrapPairIterator(self.results, self.npatch1, self.npatch2, index, self._ok)
@@ -1340,6 +1635,7 @@ class BinnedCorr2(object):
         self._read_from_data(data, params)
 
         self.results = {}
+        self.__dict__.pop('_ok',None)
         for i in range(num_zero_patch):
             zp_name = name + '_zp_%d'%i
             key, tot = eval(params[zp_name])
@@ -1507,6 +1803,8 @@ def _make_cov_design_matrix_core(corrs, plist, func, name, rank=0, size=1):
     # Make a copy of the correlation objects, so we can overwrite things without breaking
     # the original.
     corrs = [c.copy() for c in corrs]
+    for c in corrs:
+        c._pack_results()
 
     # We can't pickle functions to send via MPI, so have to do this here.
     if func is None:
@@ -1527,7 +1825,12 @@ def _make_cov_design_matrix_core(corrs, plist, func, name, rank=0, size=1):
         if row % size != rank:
             continue
         for c, cpairs in zip(corrs, pairs):
-            cpairs = list(cpairs)
+            if isinstance(cpairs, BinnedCorr2.PairIterator):
+                # Find the pairs once for this row, rather than once for the length check
+                # and again for each sum.  They are dropped again when the row is done.
+                cpairs = BinnedCorr2.FixedPairIterator(cpairs.arrays())
+            else:
+                cpairs = list(cpairs)
             if len(cpairs) == 0:
                 # This will cause problems downstream if we let it go.
                 # It probably indicates user error, using an inappropriate covariance estimator.
@@ -1539,7 +1842,7 @@ def _make_cov_design_matrix_core(corrs, plist, func, name, rank=0, size=1):
             else:
                 c._calculate_xi_from_pairs(cpairs)
         v[row] = func(corrs)
-        w[row] = np.sum([np.sum(c.getWeight()) for c in corrs])
+        w[row] = sum(np.sum(c.getWeight()) for c in corrs)
     return v,w
 
 def _make_cov_design_matrix(corrs, plist, func, name, comm=None):
@@ -1569,14 +1872,18 @@ def _cov_shot(corrs):
     # when doing finalize, or for NN also in calculateXi.
     # We return it as a covariance matrix for consistency with the other cov functions,
     # but the off diagonal terms are all zero.
-    vlist = []
-    for c in corrs:
-        v = c.getWeight().copy()
-        mask1 = v != 0
-        # Note: if w=0 anywhere, leave v=0 there, rather than divide by zero.
-        v[mask1] = c._var_num / v[mask1]
-        vlist.append(v)
-    return np.diag(np.concatenate(vlist))  # Return as a covariance matrix
+    wlist = [c.getWeight() for c in corrs]
+    # Return as a covariance matrix.  Write the variances directly into a view of the
+    # diagonal rather than concatenating them into a temporary array first.
+    n = sum(len(w) for w in wlist)
+    C = np.zeros((n,n))
+    diag = C.reshape(-1)[::n+1]
+    k = 0
+    for c, w in zip(corrs, wlist):
+        # Note: if w=0 anywhere, leave the variance 0 there, rather than divide by zero.
+        np.divide(c._var_num, w, out=diag[k:k+len(w)], where=(w != 0))
+        k += len(w)
+    return C
 
 def _check_patch_nums(corrs, name):
     # Figure out what pairs (i,j) are possible for these correlation functions.
@@ -1645,17 +1952,31 @@ def _cov_sample(corrs, func, comm=None):
 
     vmean = np.mean(v, axis=0)
     v -= vmean
-    C = 1./(npatch-1) * (w * v.conj().T).dot(v)
+    if np.all(w >= 0):
+        # Scale the rows by sqrt(w) in place, so the weighted product doesn't need a scaled copy.
+        v *= np.sqrt(w)[:,np.newaxis]
+        C = 1./(npatch-1) * v.conj().T.dot(v)
+    else:
+        # Negative weights are allowed, but then sqrt(w) doesn't work.
+        C = 1./(npatch-1) * (w * v.conj().T).dot(v)
     return C
 
 def _design_marked(corrs, func, comm=None):
     npatch = _check_patch_nums(corrs, 'marked_bootstrap')
     nboot = np.max([c.num_bootstrap for c in corrs])  # use the maximum if they differ.
 
+    # Select a random set of indices to use for each bootstrap realization.  (Will have repeats.)
+    # Drawing them all at once gives the same values as drawing each row in turn.
+    # Every process draws the full set, so the random state stays in sync, but each one
+    # only builds the pairs for its own rows of the design matrix.
+    all_index = corrs[0].rng.randint(npatch, size=(nboot, npatch))
+    rank, size = (0, 1) if comm is None else (comm.rank, comm.size)
     plist = []
-    for k in range(nboot):
-        # Select a random set of indices to use.  (Will have repeats.)
-        index = corrs[0].rng.randint(npatch, size=npatch)
+    for row, index in enumerate(all_index):
+        if row % size != rank:
+            # This row is done by a different process, so don't bother finding its pairs.
+            plist.append(None)
+            continue
         vpairs = [c._marked_pairs(index) for c in corrs]
         plist.append(vpairs)
 
@@ -1689,9 +2010,15 @@ def _design_bootstrap(corrs, func, comm=None):
     npatch = _check_patch_nums(corrs, 'bootstrap')
     nboot = np.max([c.num_bootstrap for c in corrs])  # use the maximum if they differ.
 
+    # As in _design_marked, draw all the bootstrap indices at once.
+    all_index = corrs[0].rng.randint(npatch, size=(nboot, npatch))
+    rank, size = (0, 1) if comm is None else (comm.rank, comm.size)
     plist = []
-    for k in range(nboot):
-        index = corrs[0].rng.randint(npatch, size=npatch)
+    for row, index in enumerate(all_index):
+        if row % size != rank:
+            # This row is done by a different process, so don't bother finding its pairs.
+            plist.append(None)
+            continue
         vpairs = [c._bootstrap_pairs(index) for c in corrs]
         plist.append(vpairs)
 
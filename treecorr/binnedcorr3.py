@@ -25,11 +25,16 @@ from .config import merge_config, setup_logger, get
 from .util import parse_metric, metric_enum, coord_enum, set_omp_threads, lazy_property
 from .util import make_reader
 from .util import depr_pos_kwargs
-from .binnedcorr2 import estimate_multi_cov, build_multi_cov_design_matrix
+from .binnedcorr2 import estimate_multi_cov, build_multi_cov_design_matrix, _PackedResults
 
 class Namespace(object):
     pass
 
+def _nonzero_triples(ok):
+    # The (i,j,k) indices where ok is True, as a list of tuples of python ints.
+    i, j, k = np.nonzero(ok)
+    return list(zip(i.tolist(), j.tolist(), k.tolist()))
+
 class BinnedCorr3(object):
     """This class stores the results of a 3-point correlation calculation, along with some
     ancillary data.
@@ -625,7 +630,7 @@ class BinnedCorr3(object):
     def nonzero(self):
         """Return if there are any values accumulated yet.  (i.e. ntri > 0)
         """
-        return np.any(self.ntri)
+        return self.ntri.any()
 
     def _add_tot(self, i, j, k, c1, c2, c3):
         # No op for all but NNCorrelation, which needs to add the tot value
@@ -691,7 +696,8 @@ class BinnedCorr3(object):
             if comm:
                 size = comm.Get_size()
                 rank = comm.Get_rank()
-                my_indices = np.arange(n * rank // size, n * (rank+1) // size)
+                # Use a range, so `i in my_indices` in is_my_job is a cheap O(1) check.
+                my_indices = range(n * rank // size, n * (rank+1) // size)
                 self.logger.info("Rank %d: My indices are %s",rank,my_indices)
             else:
                 my_indices = None
@@ -843,7 +849,7 @@ class BinnedCorr3(object):
                 size = comm.Get_size()
                 rank = comm.Get_rank()
                 n = max(n1,n2)
-                my_indices = np.arange(n * rank // size, n * (rank+1) // size)
+                my_indices = range(n * rank // size, n * (rank+1) // size)
                 self.logger.info("Rank %d: My indices are %s",rank,my_indices)
             else:
                 my_indices = None
@@ -963,7 +969,7 @@ class BinnedCorr3(object):
                 size = comm.Get_size()
                 rank = comm.Get_rank()
                 n = max(n1,n2,n3)
-                my_indices = np.arange(n * rank // size, n * (rank+1) // size)
+                my_indices = range(n * rank // size, n * (rank+1) // size)
                 self.logger.info("Rank %d: My indices are %s",rank,my_indices)
             else:
                 my_indices = None
@@ -1201,12 +1207,12 @@ class BinnedCorr3(object):
             self.meand3[mask] = 2. * np.arcsin(self.meand3[mask]/2.)
             self.meanlogd3[mask] = np.log(2.*np.arcsin(np.exp(self.meanlogd3[mask])/2.))
 
-        self.meand1[mask] /= self._sep_units
-        self.meanlogd1[mask] -= self._log_sep_units
-        self.meand2[mask] /= self._sep_units
-        self.meanlogd2[mask] -= self._log_sep_units
-        self.meand3[mask] /= self._sep_units
-        self.meanlogd3[mask] -= self._log_sep_units
+        # Use where=mask rather than indexing with mask, so numpy can do these in place without
+        # gathering and scattering the masked elements.
+        for meand in (self.meand1, self.meand2, self.meand3):
+            np.divide(meand, self._sep_units, out=meand, where=mask)
+        for meanlogd in (self.meanlogd1, self.meanlogd2, self.meanlogd3):
+            np.subtract(meanlogd, self._log_sep_units, out=meanlogd, where=mask)
 
     def _get_minmax_size(self):
         if self.metric == 'Euclidean':
@@ -1229,83 +1235,104 @@ class BinnedCorr3(object):
     def _get_npatch(self):
         return max(self.npatch1, self.npatch2, self.npatch3)
 
+    def _pack_results(self):
+        # Stack the results, so _sum_pairs can be done efficiently.  This should only be done
+        # when the results won't change anymore, e.g. on the copies used for the covariance
+        # design matrix.
+        self._packed_results = _PackedResults(self.results)
+
+    def _sum_pairs(self, pairs):
+        # Equivalent to self._sum([self.results[ij] for ij in pairs]), but faster if the results
+        # have been packed.
+        packed = getattr(self, '_packed_results', None)
+        if packed is None:
+            self._sum([self.results[ij] for ij in pairs])
+        else:
+            self._sum([packed.sum(pairs)])
+
     def _calculate_xi_from_pairs(self, pairs):
         # Compute the xi data vector for the given list of pairs.
         # pairs is input as a list of (i,j) values.
 
         # This is the normal calculation.  It needs to be overridden when there are randoms.
-        self._sum([self.results[ij] for ij in pairs])
+        self._sum_pairs(pairs)
         self._finalize()
 
     def _jackknife_pairs(self):
+        # For each i, select all triples where none of the relevant indices is i.
+        # Rather than scanning all the results keys in python for each i, knock out the
+        # excluded slices of the ok matrix and let numpy find the rest.
         if self.npatch3 == 1:
             if self.npatch2 == 1:
                 # k=m=0
-                return [ [(j,k,m) for j,k,m in self.results.keys() if j!=i]
-                         for i in range(self.npatch1) ]
+                axes = (0,)
             elif self.npatch1 == 1:
                 # j=m=0
-                return [ [(j,k,m) for j,k,m in self.results.keys() if k!=i]
-                         for i in range(self.npatch2) ]
+                axes = (1,)
             else:
                 # m=0
                 assert self.npatch1 == self.npatch2
-                return [ [(j,k,m) for j,k,m in self.results.keys() if j!=i and k!=i]
-                         for i in range(self.npatch1) ]
+                axes = (0,1)
         elif self.npatch2 == 1:
             if self.npatch1 == 1:
                 # j=k=0
-                return [ [(j,k,m) for j,k,m in self.results.keys() if m!=i]
-                         for i in range(self.npatch3) ]
+                axes = (2,)
             else:
                 # k=0
                 assert self.npatch1 == self.npatch3
-                return [ [(j,k,m) for j,k,m in self.results.keys() if j!=i and m!=i]
-                         for i in range(self.npatch1) ]
+                axes = (0,2)
         elif self.npatch1 == 1:
             # j=0
             assert self.npatch2 == self.npatch3
-            return [ [(j,k,m) for j,k,m in self.results.keys() if k!=i and m!=i]
-                     for i in range(self.npatch2) ]
+            axes = (1,2)
         else:
             assert self.npatch1 == self.npatch2 == self.npatch3
-            return [ [(j,k,m) for j,k,m in self.results.keys() if j!=i and k!=i and m!=i]
-                     for i in range(self.npatch1) ]
+            axes = (0,1,2)
+        ret = []
+        for i in range(self._ok.shape[axes[0]]):
+            ok = self._ok.copy()
+            for axis in axes:
+                ok[(slice(None),)*axis + (i,)] = False
+            ret.append(_nonzero_triples(ok))
+        return ret
 
     def _sample_pairs(self):
+        # For each i, select all triples where the relevant index is i.
+        # As for the jackknife, use the ok matrix rather than scanning the results keys for
+        # each i.
         if self.npatch3 == 1:
             if self.npatch2 == 1:
                 # k=m=0
-                return [ [(j,k,m) for j,k,m in self.results.keys() if j==i]
-                         for i in range(self.npatch1) ]
+                axis = 0
             elif self.npatch1 == 1:
                 # j=m=0
-                return [ [(j,k,m) for j,k,m in self.results.keys() if k==i]
-                         for i in range(self.npatch2) ]
+                axis = 1
             else:
                 # m=0
                 assert self.npatch1 == self.npatch2
-                return [ [(j,k,m) for j,k,m in self.results.keys() if j==i]
-                         for i in range(self.npatch1) ]
+                axis = 0
         elif self.npatch2 == 1:
             if self.npatch1 == 1:
                 # j=k=0
-                return [ [(j,k,m) for j,k,m in self.results.keys() if m==i]
-                         for i in range(self.npatch3) ]
+                axis = 2
             else:
                 # k=0
                 assert self.npatch1 == self.npatch3
-                return [ [(j,k,m) for j,k,m in self.results.keys() if j==i]
-                         for i in range(self.npatch1) ]
+                axis = 0
         elif self.npatch1 == 1:
             # j=0
             assert self.npatch2 == self.npatch3
-            return [ [(j,k,m) for j,k,m in self.results.keys() if k==i]
-                     for i in range(self.npatch2) ]
+            axis = 1
         else:
             assert self.npatch1 == self.npatch2 == self.npatch3
-            return [ [(j,k,m) for j,k,m in self.results.keys() if j==i]
-                     for i in range(self.npatch1) ]
+            axis = 0
+        ret = []
+        for i in range(self._ok.shape[axis]):
+            ok = np.zeros_like(self._ok)
+            s = (slice(None),)*axis + (i,)
+            ok[s] = self._ok[s]
+            ret.append(_nonzero_triples(ok))
+        return ret
 
     @lazy_property
     def _ok(self):
@@ -1315,53 +1342,69 @@ class BinnedCorr3(object):
         return ok
 
     def _marked_pairs(self, indx):
+        # These are all done by gathering the relevant slices of the ok matrix at indx, so
+        # numpy does the loops over indx and the other indices.
+        indx = np.asarray(indx)
         if self.npatch3 == 1:
             if self.npatch2 == 1:
-                return [ (i,0,0) for i in indx if self._ok[i,0,0] ]
+                return [ (i,0,0) for i in indx[self._ok[indx,0,0]].tolist() ]
             elif self.npatch1 == 1:
-                return [ (0,i,0) for i in indx if self._ok[0,i,0] ]
+                return [ (0,i,0) for i in indx[self._ok[0,indx,0]].tolist() ]
             else:
                 assert self.npatch1 == self.npatch2
                 # Select all pairs where first point is in indx (repeating i as appropriate)
-                return [ (i,j,0) for i in indx for j in range(self.npatch2) if self._ok[i,j,0] ]
+                a, j = np.nonzero(self._ok[indx,:,0])
+                return [ (i,j,0) for i,j in zip(indx[a].tolist(), j.tolist()) ]
         elif self.npatch2 == 1:
             if self.npatch1 == 1:
-                return [ (0,0,i) for i in indx if self._ok[0,0,i] ]
+                return [ (0,0,i) for i in indx[self._ok[0,0,indx]].tolist() ]
             else:
                 assert self.npatch1 == self.npatch3
                 # Select all pairs where first point is in indx (repeating i as appropriate)
-                return [ (i,0,j) for i in indx for j in range(self.npatch3) if self._ok[i,0,j] ]
+                a, j = np.nonzero(self._ok[indx,0,:])
+                return [ (i,0,j) for i,j in zip(indx[a].tolist(), j.tolist()) ]
         elif self.npatch1 == 1:
             assert self.npatch2 == self.npatch3
             # Select all pairs where first point is in indx (repeating i as appropriate)
-            return [ (0,i,j) for i in indx for j in range(self.npatch3) if self._ok[0,i,j] ]
+            a, j = np.nonzero(self._ok[0,indx,:])
+            return [ (0,i,j) for i,j in zip(indx[a].tolist(), j.tolist()) ]
         else:
             assert self.npatch1 == self.npatch2 == self.npatch3
             # Select all pairs where first point is in indx (repeating i as appropriate)
-            return [ (i,j,k) for i in indx for j in range(self.npatch2)
-                                           for k in range(self.npatch3) if self._ok[i,j,k] ]
+            a, j, k = np.nonzero(self._ok[indx])
+            return list(zip(indx[a].tolist(), j.tolist(), k.tolist()))
 
     def _bootstrap_pairs(self, indx):
+        # As in _marked_pairs, the loops over indx are done by numpy selections from the
+        # ok matrix.  The order of the triples is the same as the natural python loops.
+        indx = np.asarray(indx)
+        # ne[a,b] is whether the a-th and b-th selected patches are different patches.
+        ne = indx[:,np.newaxis] != indx[np.newaxis,:]
+        I = indx[:,np.newaxis]  # i in the outer loop
+        J = indx[np.newaxis,:]  # j in the inner loop
         if self.npatch3 == 1:
             if self.npatch2 == 1:
-                return [ (i,0,0) for i in indx if self._ok[i,0,0] ]
+                return [ (i,0,0) for i in indx[self._ok[indx,0,0]].tolist() ]
             elif self.npatch1 == 1:
-                return [ (0,i,0) for i in indx if self._ok[0,i,0] ]
+                return [ (0,i,0) for i in indx[self._ok[0,indx,0]].tolist() ]
             else:
                 assert self.npatch1 == self.npatch2
-                return ([ (i,i,0) for i in indx if self._ok[i,i,0] ] +
-                        [ (i,j,0) for i in indx for j in indx if self._ok[i,j,0] and i!=j ])
+                a, b = np.nonzero(self._ok[I,J,0] & ne)
+                return ([ (i,i,0) for i in indx[self._ok[indx,indx,0]].tolist() ] +
+                        [ (i,j,0) for i,j in zip(indx[a].tolist(), indx[b].tolist()) ])
         elif self.npatch2 == 1:
             if self.npatch1 == 1:
-                return [ (0,0,i) for i in indx if self._ok[0,0,i] ]
+                return [ (0,0,i) for i in indx[self._ok[0,0,indx]].tolist() ]
             else:
                 assert self.npatch1 == self.npatch3
-                return ([ (i,0,i) for i in indx if self._ok[i,0,i] ] +
-                        [ (i,0,j) for i in indx for j in indx if self._ok[i,0,j] and i!=j ])
+                a, b = np.nonzero(self._ok[I,0,J] & ne)
+                return ([ (i,0,i) for i in indx[self._ok[indx,0,indx]].tolist() ] +
+                        [ (i,0,j) for i,j in zip(indx[a].tolist(), indx[b].tolist()) ])
         elif self.npatch1 == 1:
             assert self.npatch2 == self.npatch3
-            return ([ (0,i,i) for i in indx if self._ok[0,i,i] ] +
-                    [ (0,i,j) for i in indx for j in indx if self._ok[0,i,j] and i!=j ])
+            a, b = np.nonzero(self._ok[0,I,J] & ne)
+            return ([ (0,i,i) for i in indx[self._ok[0,indx,indx]].tolist() ] +
+                    [ (0,i,j) for i,j in zip(indx[a].tolist(), indx[b].tolist()) ])
         else:
             # Like for 2pt we want to avoid getting extra copies of what are actually
             # auto-correlations coming from two indices equalling each other in (i,j,k).
@@ -1371,12 +1414,20 @@ class BinnedCorr3(object):
             # Finally get all triples (i,j,k) where they are all different repeated as often
             # as they show up in the triple for loop.
             assert self.npatch1 == self.npatch2 == self.npatch3
-            return ([ (i,i,i) for i in indx if self._ok[i,i,i] ] +
-                    [ (i,i,j) for i in indx for j in indx if self._ok[i,i,j] and i!=j ] +
-                    [ (i,j,i) for i in indx for j in indx if self._ok[i,j,i] and i!=j ] +
-                    [ (j,i,i) for i in indx for j in indx if self._ok[j,i,i] and i!=j ] +
-                    [ (i,j,k) for i in indx for j in indx if i!=j
-                              for k in indx if self._ok[i,j,k] and (i!=k and j!=k) ])
+            ii = indx[self._ok[indx,indx,indx]].tolist()
+            a1, b1 = np.nonzero(self._ok[I,I,J] & ne)
+            a2, b2 = np.nonzero(self._ok[I,J,I] & ne)
+            a3, b3 = np.nonzero(self._ok[J,I,I] & ne)
+            ne3 = ne[:,:,np.newaxis] & ne[:,np.newaxis,:] & ne[np.newaxis,:,:]
+            a4, b4, c4 = np.nonzero(self._ok[np.ix_(indx,indx,indx)] & ne3)
+            i1, j1 = indx[a1].tolist(), indx[b1].tolist()
+            i2, j2 = indx[a2].tolist(), indx[b2].tolist()
+            i3, j3 = indx[a3].tolist(), indx[b3].tolist()
+            return (list(zip(ii, ii, ii)) +
+                    list(zip(i1, i1, j1)) +
+                    list(zip(i2, j2, i2)) +
+                    list(zip(j3, i3, i3)) +
+                    list(zip(indx[a4].tolist(), indx[b4].tolist(), indx[c4].tolist())))
 
     def _write(self, writer, name, write_patch_results, zero_tot=False):
         # These helper properties define what to write for each class.
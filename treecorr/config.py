@@ -188,7 +188,11 @@ def setup_logger(verbose, log_file=None):
         formatter = logging.Formatter('%(message)s')  # Simple text output
         handle.setFormatter(formatter)
         logger.addHandler(handle)
-    logger.setLevel(logging_level)
+    if logger.level != logging_level:
+        # setLevel clears the cache of every logger, so only call it when something changes.
+        # (This gets called for each unpickled correlation object, e.g. the patch results
+        # sent between processes with MPI.)
+        logger.setLevel(logging_level)
     return logger
 
 
@@ -283,12 +287,10 @@ def check_config(config, params, aliases=None, logger=None):
         config[key] = value
 
     # Write the defaults for other parameters to simplify the syntax of getting the values
-    for key in params:
-        if key in config:
-            continue
-        value_type, may_be_list, default_value, valid_values = params[key][:4]
-        if default_value is not None:
-            config[key] = default_value
+    # This is done for every correlation object that gets made, so keep the loop lean.
+    for key, info in params.items():
+        if info[2] is not None and key not in config:
+            config[key] = info[2]
 
     return config
 
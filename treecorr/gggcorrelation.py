@@ -22,9 +22,25 @@ from .catalog import calculateVarG
 from .binnedcorr3 import BinnedCorr3
 from .util import double_ptr as dp
 from .util import make_writer, make_reader
-from .util import depr_pos_kwargs
+from .util import depr_pos_kwargs, lazy_property
 
 
+def _row_view(block, i):
+    # A property giving row i of the array self.<block>.  Setting it writes into that row, so
+    # e.g. the arrays that the C++ layer accumulates into are never replaced.
+    def fget(self):
+        return getattr(self, block)[i]
+    def fset(self, value):
+        getattr(self, block)[i] = value
+    return property(fget, fset)
+
+def _make_complex(re, im):
+    # Equivalent to re + 1j * im, but without the temporary complex arrays.
+    ret = np.empty(re.shape, dtype=complex)
+    ret.real = re
+    ret.imag = im
+    return ret
+
 class GGGCorrelation(BinnedCorr3):
     r"""This class handles the calculation and storage of a 3-point shear-shear-shear correlation
     function.
@@ -152,45 +168,60 @@ class GGGCorrelation(BinnedCorr3):
         self._ro._d2 = 3  # GData
         self._ro._d3 = 3  # GData
         shape = self.logr.shape
-        self.gam0r = np.zeros(shape, dtype=float)
-        self.gam1r = np.zeros(shape, dtype=float)
-        self.gam2r = np.zeros(shape, dtype=float)
-        self.gam3r = np.zeros(shape, dtype=float)
-        self.gam0i = np.zeros(shape, dtype=float)
-        self.gam1i = np.zeros(shape, dtype=float)
-        self.gam2i = np.zeros(shape, dtype=float)
-        self.gam3i = np.zeros(shape, dtype=float)
-        self.vargam0 = np.zeros(shape, dtype=float)
-        self.vargam1 = np.zeros(shape, dtype=float)
-        self.vargam2 = np.zeros(shape, dtype=float)
-        self.vargam3 = np.zeros(shape, dtype=float)
-        self.meand1 = np.zeros(shape, dtype=float)
-        self.meanlogd1 = np.zeros(shape, dtype=float)
-        self.meand2 = np.zeros(shape, dtype=float)
-        self.meanlogd2 = np.zeros(shape, dtype=float)
-        self.meand3 = np.zeros(shape, dtype=float)
-        self.meanlogd3 = np.zeros(shape, dtype=float)
-        self.meanu = np.zeros(shape, dtype=float)
-        self.meanv = np.zeros(shape, dtype=float)
-        self.weight = np.zeros(shape, dtype=float)
-        self.ntri = np.zeros(shape, dtype=float)
+        # The accumulated arrays (gam0r, ..., meanv, weight, ntri) are all rows of this one
+        # array.  See _row_view above.
+        self._data = np.zeros((len(self._data_names),) + shape, dtype=float)
         self.logger.debug('Finished building GGGCorr')
 
+    @lazy_property
+    def _vargam(self):
+        # vargam0..vargam3 are the rows of this array.  They are only set by finalize, so don't
+        # allocate them until they are needed.
+        return np.zeros((4,) + self.logr.shape, dtype=float)
+
+    # The names of the rows in _data.  All but the last two (weight, ntri) are divided by the
+    # weight in _finalize.
+    _data_names = ('gam0r', 'gam0i', 'gam1r', 'gam1i', 'gam2r', 'gam2i', 'gam3r', 'gam3i',
+                   'meand1', 'meanlogd1', 'meand2', 'meanlogd2', 'meand3', 'meanlogd3',
+                   'meanu', 'meanv', 'weight', 'ntri')
+    gam0r = _row_view('_data', 0)
+    gam0i = _row_view('_data', 1)
+    gam1r = _row_view('_data', 2)
+    gam1i = _row_view('_data', 3)
+    gam2r = _row_view('_data', 4)
+    gam2i = _row_view('_data', 5)
+    gam3r = _row_view('_data', 6)
+    gam3i = _row_view('_data', 7)
+    meand1 = _row_view('_data', 8)
+    meanlogd1 = _row_view('_data', 9)
+    meand2 = _row_view('_data', 10)
+    meanlogd2 = _row_view('_data', 11)
+    meand3 = _row_view('_data', 12)
+    meanlogd3 = _row_view('_data', 13)
+    meanu = _row_view('_data', 14)
+    meanv = _row_view('_data', 15)
+    weight = _row_view('_data', 16)
+    ntri = _row_view('_data', 17)
+    vargam0 = _row_view('_vargam', 0)
+    vargam1 = _row_view('_vargam', 1)
+    vargam2 = _row_view('_vargam', 2)
+    vargam3 = _row_view('_vargam', 3)
+
     @property
     def gam0(self):
-        return self.gam0r + 1j * self.gam0i
+        return _make_complex(self.gam0r, self.gam0i)
 
     @property
     def gam1(self):
-        return self.gam1r + 1j * self.gam1i
+        return _make_complex(self.gam1r, self.gam1i)
 
     @property
     def gam2(self):
-        return self.gam2r + 1j * self.gam2i
+        return _make_complex(self.gam2r, self.gam2i)
 
     @property
     def gam3(self):
-        return self.gam3r + 1j * self.gam3i
+        return _make_complex(self.gam3r, self.gam3i)
 
     @property
     def corr(self):
@@ -237,28 +268,8 @@ class GGGCorrelation(BinnedCorr3):
                 self.xperiod == other.xperiod and
                 self.yperiod == other.yperiod and
                 self.zperiod == other.zperiod and
-                np.array_equal(self.meand1, other.meand1) and
-                np.array_equal(self.meanlogd1, other.meanlogd1) and
-                np.array_equal(self.meand2, other.meand2) and
-                np.array_equal(self.meanlogd2, other.meanlogd2) and
-                np.array_equal(self.meand3, other.meand3) and
-                np.array_equal(self.meanlogd3, other.meanlogd3) and
-                np.array_equal(self.meanu, other.meanu) and
-                np.array_equal(self.meanv, other.meanv) and
-                np.array_equal(self.gam0r, other.gam0r) and
-                np.array_equal(self.gam0i, other.gam0i) and
-                np.array_equal(self.gam1r, other.gam1r) and
-                np.array_equal(self.gam1i, other.gam1i) and
-                np.array_equal(self.gam2r, other.gam2r) and
-                np.array_equal(self.gam2i, other.gam2i) and
-                np.array_equal(self.gam3r, other.gam3r) and
-                np.array_equal(self.gam3i, other.gam3i) and
-                np.array_equal(self.vargam0, other.vargam0) and
-                np.array_equal(self.vargam1, other.vargam1) and
-                np.array_equal(self.vargam2, other.vargam2) and
-                np.array_equal(self.vargam3, other.vargam3) and
-                np.array_equal(self.weight, other.weight) and
-                np.array_equal(self.ntri, other.ntri))
+                np.array_equal(self._data, other._data) and
+                np.array_equal(self._vargam, other._vargam))
 
     def copy(self):
         """Make a copy"""
@@ -266,6 +277,8 @@ class GGGCorrelation(BinnedCorr3):
         for key, item in self.__dict__.items():
             if isinstance(item, np.ndarray):
                 # Only items that might change need to by deep copied.
+                # Note: the gam, mean, weight, ntri, and vargam arrays are all rows of either
+                # _data or _vargam (if made yet), so this is at most two array copies.
                 ret.__dict__[key] = item.copy()
             else:
                 # For everything else, shallow copy is fine.
@@ -420,37 +433,34 @@ class GGGCorrelation(BinnedCorr3):
 
     def _finalize(self):
         mask1 = self.weight != 0
-        mask2 = self.weight == 0
-
-        self.gam0r[mask1] /= self.weight[mask1]
-        self.gam0i[mask1] /= self.weight[mask1]
-        self.gam1r[mask1] /= self.weight[mask1]
-        self.gam1i[mask1] /= self.weight[mask1]
-        self.gam2r[mask1] /= self.weight[mask1]
-        self.gam2i[mask1] /= self.weight[mask1]
-        self.gam3r[mask1] /= self.weight[mask1]
-        self.gam3i[mask1] /= self.weight[mask1]
-        self.meand1[mask1] /= self.weight[mask1]
-        self.meanlogd1[mask1] /= self.weight[mask1]
-        self.meand2[mask1] /= self.weight[mask1]
-        self.meanlogd2[mask1] /= self.weight[mask1]
-        self.meand3[mask1] /= self.weight[mask1]
-        self.meanlogd3[mask1] /= self.weight[mask1]
-        self.meanu[mask1] /= self.weight[mask1]
-        self.meanv[mask1] /= self.weight[mask1]
+        mask2 = ~mask1
+
+        # Divide gam0r..meanv by the weight in one go.  Multiplying by 1/weight where mask1
+        # avoids gathering and scattering the masked elements of every row.  Bins with no
+        # weight are left as they are.
+        inv_w = np.zeros_like(self.weight)
+        np.divide(1., self.weight, out=inv_w, where=mask1)
+        np.multiply(self._data[:-2], inv_w, out=self._data[:-2], where=mask1)
 
         # Update the units
         self._apply_units(mask1)
 
         # Use meanlogr when available, but set to nominal when no triangles in bin.
-        self.meand2[mask2] = self.rnom[mask2]
-        self.meanlogd2[mask2] = self.logr[mask2]
-        self.meanu[mask2] = self.u[mask2]
-        self.meanv[mask2] = self.v[mask2]
-        self.meand3[mask2] = self.u[mask2] * self.meand2[mask2]
-        self.meanlogd3[mask2] = np.log(self.meand3[mask2])
-        self.meand1[mask2] = np.abs(self.v[mask2]) * self.meand3[mask2] + self.meand2[mask2]
-        self.meanlogd1[mask2] = np.log(self.meand1[mask2])
+        # meand1..meanv are rows 8-15 of _data, in the same order as _nominal_means.
+        np.copyto(self._data[8:16], self._nominal_means(), where=mask2)
+
+    def _nominal_means(self):
+        # The values to use for meand1, meanlogd1, ..., meanu, meanv in bins with no triangles.
+        # These only depend on the binning, so make them once and keep them in _ro, which is
+        # shared by all copies.
+        nom = getattr(self._ro, '_nominal_means', None)
+        if nom is None:
+            meand3 = self.u * self.rnom
+            meand1 = np.abs(self.v) * meand3 + self.rnom
+            nom = np.array([meand1, np.log(meand1), self.rnom, self.logr,
+                            meand3, np.log(meand3), self.u, self.v])
+            self._ro._nominal_means = nom
+        return nom
 
     def finalize(self, varg1, varg2, varg3):
         """Finalize the calculation of the correlation function.
@@ -465,8 +475,6 @@ class GGGCorrelation(BinnedCorr3):
             varg3 (float):  The shear variance for the third field.
         """
         self._finalize()
-        mask1 = self.weight != 0
-        mask2 = self.weight == 0
         self._var_num = 4 * varg1 * varg2 * varg3
         self.cov = self.estimate_cov(self.var_method)
         # Note: diagonal should be very close to pure real.  So ok to just copy real part.
@@ -474,36 +482,14 @@ class GGGCorrelation(BinnedCorr3):
         # This should never trigger.  If you find this assert to fail, please post an
         # issue about it describing your use case that caused it to fail.
         assert np.sum(diag.imag**2) <= 1.e-8 * np.sum(diag.real**2)
-        self.vargam0.ravel()[:] = self.cov.diagonal()[0:self._nbins].real
-        self.vargam1.ravel()[:] = self.cov.diagonal()[self._nbins:2*self._nbins].real
-        self.vargam2.ravel()[:] = self.cov.diagonal()[2*self._nbins:3*self._nbins].real
-        self.vargam3.ravel()[:] = self.cov.diagonal()[3*self._nbins:4*self._nbins].real
+        # The diagonal is vargam0..vargam3 in order, which is the order of the rows of _vargam.
+        self._vargam.ravel()[:] = diag.real
 
     def _clear(self):
         """Clear the data vectors
         """
-        self.gam0r[:,:,:] = 0.
-        self.gam0i[:,:,:] = 0.
-        self.gam1r[:,:,:] = 0.
-        self.gam1i[:,:,:] = 0.
-        self.gam2r[:,:,:] = 0.
-        self.gam2i[:,:,:] = 0.
-        self.gam3r[:,:,:] = 0.
-        self.gam3i[:,:,:] = 0.
-        self.vargam0[:,:,:] = 0.
-        self.vargam1[:,:,:] = 0.
-        self.vargam2[:,:,:] = 0.
-        self.vargam3[:,:,:] = 0.
-        self.meand1[:,:,:] = 0.
-        self.meanlogd1[:,:,:] = 0.
-        self.meand2[:,:,:] = 0.
-        self.meanlogd2[:,:,:] = 0.
-        self.meand3[:,:,:] = 0.
-        self.meanlogd3[:,:,:] = 0.
-        self.meanu[:,:,:] = 0.
-        self.meanv[:,:,:] = 0.
-        self.weight[:,:,:] = 0.
-        self.ntri[:,:,:] = 0.
+        self._data.fill(0.)
+        self.__dict__.pop('_vargam',None)  # Remade as zeros when next needed.
 
     def __iadd__(self, other):
         """Add a second `GGGCorrelation`'s data to this one.
@@ -528,24 +514,7 @@ class GGGCorrelation(BinnedCorr3):
 
         if not other.nonzero: return self
         self._set_metric(other.metric, other.coords, other.coords, other.coords)
-        self.gam0r[:] += other.gam0r[:]
-        self.gam0i[:] += other.gam0i[:]
-        self.gam1r[:] += other.gam1r[:]
-        self.gam1i[:] += other.gam1i[:]
-        self.gam2r[:] += other.gam2r[:]
-        self.gam2i[:] += other.gam2i[:]
-        self.gam3r[:] += other.gam3r[:]
-        self.gam3i[:] += other.gam3i[:]
-        self.meand1[:] += other.meand1[:]
-        self.meanlogd1[:] += other.meanlogd1[:]
-        self.meand2[:] += other.meand2[:]
-        self.meanlogd2[:] += other.meanlogd2[:]
-        self.meand3[:] += other.meand3[:]
-        self.meanlogd3[:] += other.meanlogd3[:]
-        self.meanu[:] += other.meanu[:]
-        self.meanv[:] += other.meanv[:]
-        self.weight[:] += other.weight[:]
-        self.ntri[:] += other.ntri[:]
+        self._data[:] += other._data[:]
         return self
 
     def _sum(self, others):
@@ -554,24 +523,8 @@ class GGGCorrelation(BinnedCorr3):
         #     for other in others:
         #         self += other
         # but no sanity checks and use numpy.sum for faster calculation.
-        np.sum([c.gam0r for c in others], axis=0, out=self.gam0r)
-        np.sum([c.gam0i for c in others], axis=0, out=self.gam0i)
-        np.sum([c.gam1r for c in others], axis=0, out=self.gam1r)
-        np.sum([c.gam1i for c in others], axis=0, out=self.gam1i)
-        np.sum([c.gam2r for c in others], axis=0, out=self.gam2r)
-        np.sum([c.gam2i for c in others], axis=0, out=self.gam2i)
-        np.sum([c.gam3r for c in others], axis=0, out=self.gam3r)
-        np.sum([c.gam3i for c in others], axis=0, out=self.gam3i)
-        np.sum([c.meand1 for c in others], axis=0, out=self.meand1)
-        np.sum([c.meanlogd1 for c in others], axis=0, out=self.meanlogd1)
-        np.sum([c.meand2 for c in others], axis=0, out=self.meand2)
-        np.sum([c.meanlogd2 for c in others], axis=0, out=self.meanlogd2)
-        np.sum([c.meand3 for c in others], axis=0, out=self.meand3)
-        np.sum([c.meanlogd3 for c in others], axis=0, out=self.meanlogd3)
-        np.sum([c.meanu for c in others], axis=0, out=self.meanu)
-        np.sum([c.meanv for c in others], axis=0, out=self.meanv)
-        np.sum([c.weight for c in others], axis=0, out=self.weight)
-        np.sum([c.ntri for c in others], axis=0, out=self.ntri)
+        # All the accumulated arrays are summed together as the rows of _data.
+        np.sum([c._data for c in others], axis=0, out=self._data)
 
     @depr_pos_kwargs
     def process(self, cat1, cat2=None, cat3=None, *, metric=None, num_threads=None,
@@ -668,8 +621,9 @@ class GGGCorrelation(BinnedCorr3):
             The computed covariance matrix will be complex, although since it is Hermitian the
             diagonal is real, so the resulting vargam0, etc. will all be real arrays.
         """
-        return np.concatenate([self.gam0.ravel(), self.gam1.ravel(),
-                               self.gam2.ravel(), self.gam3.ravel()])
+        # The real parts of gam0..gam3 are the even rows of _data[:8], and the imaginary parts
+        # are the odd rows, so this is the same as concatenating the raveled gam0..gam3.
+        return _make_complex(self._data[0:8:2].ravel(), self._data[1:8:2].ravel())
 
     def getWeight(self):
         """The weight array for the current correlation object as a 1-d array.
@@ -800,6 +754,7 @@ class GGGCorrelation(BinnedCorr3):
             self._ro.rnom = data['r_nom'].reshape(s)
         self._ro.u = data['u_nom'].reshape(s)
         self._ro.v = data['v_nom'].reshape(s)
+        self._ro.__dict__.pop('_nominal_means',None)  # Remake from these if needed.
         self.meand1 = data['meand1'].reshape(s)
         self.meanlogd1 = data['meanlogd1'].reshape(s)
         self.meand2 = data['meand2'].reshape(s)
@@ -846,9 +801,10 @@ class GGGCorrelation(BinnedCorr3):
 
         # |qi|^2 shows up a lot, so save these.
         # The a stands for "absolute", and the ^2 part is implicit.
-        a1 = np.abs(q1)**2
-        a2 = np.abs(q2)**2
-        a3 = np.abs(q3)**2
+        # (Using re^2 + im^2 rather than np.abs(q)**2 skips the square root.)
+        a1 = q1.real**2 + q1.imag**2
+        a2 = q2.real**2 + q2.imag**2
+        a3 = q3.real**2 + q3.imag**2
         a123 = a1*a2*a3
 
         # These combinations also appear multiple times.
@@ -857,6 +813,10 @@ class GGGCorrelation(BinnedCorr3):
         b2 = np.conjugate(q2)**2*q1*q3
         b3 = np.conjugate(q3)**2*q1*q2
 
+        # Note: The real prefactors of the terms below are computed once up front, so the
+        # complex arrays get multiplied by as few separate factors as possible.  These are
+        # large arrays (len(R) x nbins), so each avoided temporary is a noticeable savings.
+
         if k1==1 and k2==1 and k3==1:
 
             # Some factors we use multiple times
@@ -877,9 +837,13 @@ class GGGCorrelation(BinnedCorr3):
             #        - (q1*^2 q2 q3)/9
             #        + (q1*^4 q2^2 q3^2 + 2 |q2 q3|^2 q1*^2 q2 q3)/(|q1 q2 q3|^2)/27
             #       ] exp(-(|q1|^2+|q2|^2+|q3|^2)/2)
-            T1 = expfactor * (a123 / 24 - b1 / 9 + (b1**2 + 2*a2*a3*b1) / (a123 * 27))
-            T2 = expfactor * (a123 / 24 - b2 / 9 + (b2**2 + 2*a1*a3*b2) / (a123 * 27))
-            T3 = expfactor * (a123 / 24 - b3 / 9 + (b3**2 + 2*a1*a2*b3) / (a123 * 27))
+            # The first term is T0, and the other two are both proportional to b1, so
+            # T1 = T0 + b1 [(b1 + 2 a2 a3) expfactor/(27 a123) - expfactor/9]
+            C = expfactor / (27 * a123)
+            B = expfactor / 9
+            T1 = T0 + b1 * (C * (b1 + 2*a2*a3) - B)
+            T2 = T0 + b2 * (C * (b2 + 2*a1*a3) - B)
+            T3 = T0 + b3 * (C * (b3 + 2*a1*a2) - B)
 
         else:
             # SKL Equation 63:
@@ -907,6 +871,9 @@ class GGGCorrelation(BinnedCorr3):
             f1c = np.conjugate(f1)
             f2c = np.conjugate(f2)
             f3c = np.conjugate(f3)
+            f1c2 = f1c**2
+            f2c2 = f2c**2
+            f3c2 = f3c**2
 
             # SKL Equation 69:
             g1 = k2sq*k3sq + (k3sq-k2sq)*k1sq*(q2-q3)/(3*q1)
@@ -916,22 +883,24 @@ class GGGCorrelation(BinnedCorr3):
             g2c = np.conjugate(g2)
             g3c = np.conjugate(g3)
 
+            # The real prefactors of the three kinds of terms in T0..T3.
+            A = expfactor * a123 / (24*Theta6)
+            B = expfactor / (9*Theta4)
+            C = expfactor / (a123 * 27*Theta2)
+
             # SKL Equation 62:
-            T0 = expfactor * a123 * f1c**2 * f2c**2 * f3c**2 / (24.*Theta6)
+            T0 = A * f1c2 * f2c2 * f3c2
 
             # SKL Equation 68:
-            T1 = expfactor * (
-                a123 * f1**2 * f2c**2 * f3c**2 / (24*Theta6) -
-                b1 * f1*f2c*f3c*g1c / (9*Theta4) +
-                (b1**2 * g1c**2 + 2*k2sq*k3sq*a2*a3*b1 * f2c * f3c) / (a123 * 27*Theta2))
-            T2 = expfactor * (
-                a123 * f1c**2 * f2**2 * f3c**2 / (24*Theta6) -
-                b2 * f1c*f2*f3c*g2c / (9*Theta4) +
-                (b2**2 * g2c**2 + 2*k1sq*k3sq*a1*a3*b2 * f1c * f3c) / (a123 * 27*Theta2))
-            T3 = expfactor * (
-                a123 * f1c**2 * f2c**2 * f3**2 / (24*Theta6) -
-                b3 * f1c*f2c*f3*g3c / (9*Theta4) +
-                (b3**2 * g3c**2 + 2*k1sq*k2sq*a1*a2*b3 * f1c * f2c) / (a123 * 27*Theta2))
+            T1 = (A * f1**2 * f2c2 * f3c2 -
+                  B * b1 * f1*f2c*f3c*g1c +
+                  C * b1 * (b1 * g1c**2 + 2*k2sq*k3sq*a2*a3 * f2c * f3c))
+            T2 = (A * f1c2 * f2**2 * f3c2 -
+                  B * b2 * f1c*f2*f3c*g2c +
+                  C * b2 * (b2 * g2c**2 + 2*k1sq*k3sq*a1*a3 * f1c * f3c))
+            T3 = (A * f1c2 * f2c2 * f3**2 -
+                  B * b3 * f1c*f2c*f3*g3c +
+                  C * b3 * (b3 * g3c**2 + 2*k1sq*k2sq*a1*a2 * f1c * f2c))
 
         return T0, T1, T2, T3
 
@@ -1037,7 +1006,7 @@ class GGGCorrelation(BinnedCorr3):
         tx[bad] = 0  # for now to avoid nans
         ty = np.sqrt(d3**2 - tx**2)
         ty[:,self.meanv.ravel() > 0] *= -1.
-        t = tx + 1j * ty
+        t = _make_complex(tx, ty)
 
         # Next we need to construct the T values.
         T0, T1, T2, T3 = self._calculateT(s,t,1.,k2,k3)
@@ -1497,6 +1466,11 @@ class GGGCrossCorrelation(BinnedCorr3):
         self.g3g2g1 += other.g3g2g1
         return self
 
+    def _pack_results(self):
+        # The results here hold lists of component correlations, which can't be stacked
+        # into arrays.  Leave them unpacked, so _sum_pairs uses the regular _sum.
+        pass
+
     def _sum(self, others):
         # Equivalent to the operation of:
         #     self._clear()
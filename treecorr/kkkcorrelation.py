@@ -976,6 +976,11 @@ class KKKCrossCorrelation(BinnedCorr3):
         self.k3k2k1 += other.k3k2k1
         return self
 
+    def _pack_results(self):
+        # The results here hold lists of component correlations, which can't be stacked
+        # into arrays.  Leave them unpacked, so _sum_pairs uses the regular _sum.
+        pass
+
     def _sum(self, others):
         # Equivalent to the operation of:
         #     self._clear()
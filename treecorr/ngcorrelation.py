@@ -472,6 +472,7 @@ class NGCorrelation(BinnedCorr2):
                     new_cij.xi.ravel()[:] = 0
                     new_cij.weight.ravel()[:] = 0
                     self.results[ij] = new_cij
+                self.__dict__.pop('_ok',None)  # If it was already made, it will need to be redone.
 
                 self._cov = self.estimate_cov(self.var_method)
                 self._varxi = np.zeros_like(self.rnom, dtype=float)
@@ -485,8 +486,14 @@ class NGCorrelation(BinnedCorr2):
 
         return self.xi, self.xi_im, self.varxi
 
+    def _pack_results(self):
+        BinnedCorr2._pack_results(self)
+        # The randoms are summed over the same pairs, so pack them too.
+        if self._rg is not None:
+            self._rg._pack_results()
+
     def _calculate_xi_from_pairs(self, pairs):
-        self._sum([self.results[ij] for ij in pairs])
+        self._sum_pairs(pairs)
         self._finalize()
         if self._rg is not None:
             # If rg has npatch1 = 1, adjust pairs appropriately
@@ -653,8 +653,27 @@ class NNCorrelation(BinnedCorr2):
         self.varxi = self.cov.diagonal()
         return self.xi, self.varxi
 
+    def _pack_results(self):
+        BinnedCorr2._pack_results(self)
+        # The randoms are summed over the same pairs, so pack them too.
+        for r in (self._rr, self._dr, self._rd):
+            if r is not None:
+                r._pack_results()
+        self._packed_tots = self._results_tots()
+
+    def _results_tots(self):
+        # The total tot over all the results, and the sum of tot**0.5 over the auto-correlation
+        # results.  These don't depend on the pairs being used, so when the results are packed,
+        # they are only computed once, rather than for every row of the design matrix.
+        packed_tots = getattr(self, '_packed_tots', None)
+        if packed_tots is not None:
+            return packed_tots
+        tot = np.sum([cij.tot for cij in self.results.values()])
+        auto_tot = np.sum([cij.tot**0.5 for ij,cij in self.results.items() if ij[0] == ij[1]])
+        return tot, auto_tot
+
     def _calculate_xi_from_pairs(self, pairs):
-        self._sum([self.results[ij] for ij in pairs])
+        self._sum_pairs(pairs)
         self._finalize()
         if self._rr is None:
             return
@@ -663,7 +682,7 @@ class NNCorrelation(BinnedCorr2):
             # This is the usual case.  R has patches just like D.
             # Calculate rr and rrf in the normal way based on the same pairs as used for DD.
             pairs1 = [ij for ij in pairs if self._rr._ok[ij[0],ij[1]]]
-            self._rr._sum([self._rr.results[ij] for ij in pairs1])
+            self._rr._sum_pairs(pairs1)
             dd_tot = self.tot
         else:
             # In this case, R was not run with patches.
@@ -672,10 +691,11 @@ class NNCorrelation(BinnedCorr2):
             # The approximation we'll use is that tot in the auto-correlations is
             # proportional to area**2.
             # So the sum of tot**0.5 when i==j gives an estimate of the fraction of the total area.
+            all_tot, all_auto_tot = self._results_tots()
             area_frac = np.sum([self.results[ij].tot**0.5 for ij in pairs if ij[0] == ij[1]])
-            area_frac /= np.sum([cij.tot**0.5 for ij,cij in self.results.items() if ij[0] == ij[1]])
+            area_frac /= all_auto_tot
             # First figure out the original total for all DD that had the same footprint as RR.
-            dd_tot = np.sum([self.results[ij].tot for ij in self.results])
+            dd_tot = all_tot
             # The rrf we want will be a factor of area_frac smaller than the original
             # dd_tot/rr_tot.  We can effect this by multiplying the full dd_tot by area_frac
             # and use that value normally below.  (Also for drf and rdf.)
@@ -690,7 +710,7 @@ class NNCorrelation(BinnedCorr2):
                 pairs2 = [(ij[0],0) for ij in pairs if ij[0] == ij[1]]
             else:
                 pairs2 = [ij for ij in pairs if self._dr._ok[ij[0],ij[1]]]
-            self._dr._sum([self._dr.results[ij] for ij in pairs2])
+            self._dr._sum_pairs(pairs2)
             dr = self._dr.weight
             drf = dd_tot / self._dr.tot
         if self._rd is not None:
@@ -699,7 +719,7 @@ class NNCorrelation(BinnedCorr2):
                 pairs3 = [(0,ij[1]) for ij in pairs if ij[0] == ij[1]]
             else:
                 pairs3 = [ij for ij in pairs if self._rd._ok[ij[0],ij[1]]]
-            self._rd._sum([self._rd.results[ij] for ij in pairs3])
+            self._rd._sum_pairs(pairs3)
             rd = self._rd.weight
             rdf = dd_tot / self._rd.tot
         denom = rr * rrf
@@ -763,10 +763,31 @@ class NNNCorrelation(BinnedCorr3):
         self.varzeta = self.cov.diagonal().reshape(self.zeta.shape)
         return self.zeta, self.varzeta
 
+    def _pack_results(self):
+        BinnedCorr3._pack_results(self)
+        # The randoms are summed over the same pairs, so pack them too.
+        for r in (self._rrr, self._drr, self._rdd):
+            if r is not None:
+                r._pack_results()
+        self._packed_tots = self._results_tots()
+
+    def _results_tots(self):
+        # The total tot over all the results, and the sum of tot**(1/3) over the
+        # auto-correlation results.  These don't depend on the pairs being used, so when the
+        # results are packed, they are only computed once, rather than for every row of the
+        # design matrix.
+        packed_tots = getattr(self, '_packed_tots', None)
+        if packed_tots is not None:
+            return packed_tots
+        tot = np.sum([cijk.tot for cijk in self.results.values()])
+        auto_tot = np.sum([cijk.tot**(1./3.) for ijk,cijk in self.results.items()
+                           if ijk[0] == ijk[1] == ijk[2]])
+        return tot, auto_tot
+
     def _calculate_xi_from_pairs(self, pairs):
         # Note: we keep the notation ij and pairs here, even though they are really ijk and
         # triples.
-        self._sum([self.results[ij] for ij in pairs])
+        self._sum_pairs(pairs)
         self._finalize()
         if self._rrr is None:
             return
@@ -775,7 +796,7 @@ class NNNCorrelation(BinnedCorr3):
             # This is the usual case.  R has patches just like D.
             # Calculate rrr and rrrf in the normal way based on the same pairs as used for DDD.
             pairs1 = [ij for ij in pairs if self._rrr._ok[ij[0],ij[1],ij[2]]]
-            self._rrr._sum([self._rrr.results[ij] for ij in pairs1])
+            self._rrr._sum_pairs(pairs1)
             ddd_tot = self.tot
         else:
             # In this case, R was not run with patches.
@@ -783,12 +804,12 @@ class NNNCorrelation(BinnedCorr3):
             # The approximation we'll use is that tot in the auto-correlations is
             # proportional to area**3.
             # The sum of tot**(1/3) when i=j=k gives an estimate of the fraction of the total area.
+            all_tot, all_auto_tot = self._results_tots()
             area_frac = np.sum([self.results[ij].tot**(1./3.) for ij in pairs
                                 if ij[0] == ij[1] == ij[2]])
-            area_frac /= np.sum([cij.tot**(1./3.) for ij,cij in self.results.items()
-                                 if ij[0] == ij[1] == ij[2]])
+            area_frac /= all_auto_tot
             # First figure out the original total for all DDD that had the same footprint as RRR.
-            ddd_tot = np.sum([self.results[ij].tot for ij in self.results])
+            ddd_tot = all_tot
             # The rrrf we want will be a factor of area_frac smaller than the original
             # ddd_tot/rrr_tot.  We can effect this by multiplying the full ddd_tot by area_frac
             # and use that value normally below.  (Also for drrf and rddf.)
@@ -803,7 +824,7 @@ class NNNCorrelation(BinnedCorr3):
                 pairs2 = [(ij[0],0,0) for ij in pairs if ij[0] == ij[1] == ij[2]]
             else:
                 pairs2 = [ij for ij in pairs if self._drr._ok[ij[0],ij[1],ij[2]]]
-            self._drr._sum([self._drr.results[ij] for ij in pairs2])
+            self._drr._sum_pairs(pairs2)
             drr = self._drr.weight
             drrf = ddd_tot / self._drr.tot
         if self._rdd is not None:
@@ -813,7 +834,7 @@ class NNNCorrelation(BinnedCorr3):
                 pairs3 = [(0,ij[1],ij[2]) for ij in pairs if ij[0] == ij[1] or ij[0] == ij[2]]
             else:
                 pairs3 = [ij for ij in pairs if self._rdd._ok[ij[0],ij[1],ij[2]]]
-            self._rdd._sum([self._rdd.results[ij] for ij in pairs3])
+            self._rdd._sum_pairs(pairs3)
             rdd = self._rdd.weight
             rddf = ddd_tot / self._rdd.tot
         denom = rrr * rrrf
@@ -1326,6 +1347,11 @@ class NNNCrossCorrelation(BinnedCorr3):
             nnn._clear()
         self.tot = 0
 
+    def _pack_results(self):
+        # The results here hold lists of component correlations, which can't be stacked
+        # into arrays.  Leave them unpacked, so _sum_pairs uses the regular _sum.
+        pass
+
     def _sum(self, others):
         # Equivalent to the operation of:
         #     self._clear()